@@ -8,8 +8,10 @@ requirements = [
     "bibtexparser",
     "gensim",
     "numpy",
+    "orjson",
     "pandas",
     "plotnine",
+    "pyarrow",
     "scikit-learn",
     "scipy==1.10.1",
     "sentence-transformers",
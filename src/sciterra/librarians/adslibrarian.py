@@ -1,9 +1,9 @@
 import ads
 
 from ads.search import Article
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime
 
-from sciterra.mapping.publication import Publication
 from ..mapping.publication import Publication
 from .librarian import Librarian
 
@@ -17,6 +17,7 @@ CALL_SIZE = (
     50  # handles more than 2000, much better than S2; but easy to hit TooManyRequests
 )
 NUM_ATTEMPTS_PER_QUERY = 10
+NUM_WORKERS = 4  # number of chunks queried concurrently
 
 QUERY_FIELDS = [
     "bibcode",  # str
@@ -31,6 +32,8 @@ QUERY_FIELDS = [
     "identifier",  # list of external ids
     "arxiv_class",  # list of arxiv classifiers; interestingly, returned even for DOIs that aren't arxiv
 ]
+# the solr 'fl' parameter, joined once rather than sent as a repeated parameter for every field in every request
+QUERY_FL = ",".join(QUERY_FIELDS)
 
 ALLOWED_EXCEPTIONS = (ads.exceptions.APIResponseError,)
 
@@ -62,6 +65,7 @@ class ADSLibrarian(Librarian):
         *args,
         call_size: int = CALL_SIZE,
         n_attempts_per_query: int = NUM_ATTEMPTS_PER_QUERY,
+        num_workers: int = NUM_WORKERS,
         convert: bool = True,
         **kwargs,
     ) -> list[Publication]:
@@ -74,6 +78,8 @@ class ADSLibrarian(Librarian):
 
             call_size: maximum number of papers to call API for in one query; if less than `len(bibcodes)`, chunking will be performed.
 
+            num_workers: number of chunks to query the API for concurrently. Since network latency dominates retrieval time, overlapping requests in a thread pool substantially reduces wall time; set to 1 to query sequentially.
+
             convert: whether to convert each resulting ADS Article to sciterra Publications (True by default).
 
         Returns:
@@ -87,46 +93,89 @@ class ADSLibrarian(Librarian):
         if call_size is None:
             call_size = CALL_SIZE
 
-        total = len(bibcodes)
-        chunked_ids = chunk_ids(
-            bibcodes,
-            call_size=call_size,
-        )
+        if num_workers is None:
+            num_workers = NUM_WORKERS
 
         if None in bibcodes:
             # any Nones should have been handled by this point
             raise Exception("Passed `bibcodes` contains None.")
 
-        print(f"Querying ADS for {len(bibcodes)} total papers.")
+        # Query each distinct id only once, preserving order
+        unique_ids = list(dict.fromkeys(bibcodes))
+
+        total = len(unique_ids)
+        chunked_ids = chunk_ids(
+            unique_ids,
+            call_size=call_size,
+        )
+
+        print(f"Querying ADS for {len(unique_ids)} total papers.")
         papers = []
         pbar = tqdm(desc=f"progress using call_size={call_size}", total=total)
-        for ids in chunked_ids:
 
-            @keep_trying(
-                n_attempts=n_attempts_per_query,
-                allowed_exceptions=ALLOWED_EXCEPTIONS,
-                sleep_after_attempt=2,
+        def get_paper(query: str) -> Article:
+            # request and retrieve only the first (best) match, or None if there is none
+            return next(
+                iter(
+                    ads.SearchQuery(
+                        query_dict={
+                            "q": query,
+                            "fl": QUERY_FL,
+                            "rows": 1,
+                        }
+                    )
+                ),
+                None,
             )
-            def get_papers() -> list[Article]:
-                return [
-                    list(
-                        ads.SearchQuery(
-                            query_dict={
-                                "q": query,
-                                "fl": QUERY_FIELDS,
-                            }
-                        )
-                    )[
-                        0  # screw black, this is ugly
-                    ]  # retrieve from generator
-                    for query in ids
-                ]
-
-            papers.extend(get_papers())
-            pbar.update(len(ids))
+
+        @keep_trying(
+            n_attempts=n_attempts_per_query,
+            allowed_exceptions=ALLOWED_EXCEPTIONS,
+            sleep_after_attempt=2,
+        )
+        def get_papers(ids: list[str]) -> list[Article]:
+            # Query all plain bibcodes (i.e., not 'doi:' or 'arxiv:' ids) of the chunk in a single request, instead of one request per bibcode
+            articles = {}
+            bibcodes = [id for id in ids if ":" not in id]
+            if bibcodes:
+                query = "bibcode:(" + " OR ".join(f'"{id}"' for id in bibcodes) + ")"
+                for article in ads.SearchQuery(
+                    query_dict={
+                        "q": query,
+                        "fl": QUERY_FL,
+                        "rows": len(bibcodes),
+                    }
+                ):
+                    # match results back to queries by any of their identifiers, since ADS also returns papers for alternate bibcodes
+                    for identifier in [article.bibcode] + (article.identifier or []):
+                        articles.setdefault(identifier, article)
+
+            # Fall back to separate queries for other identifiers, and bibcodes that were not matched
+            return [articles[id] if id in articles else get_paper(id) for id in ids]
+
+        def get_papers_or_nones(ids: list[str]) -> list[Article]:
+            # a chunk that still fails after all attempts should not discard the results of the other chunks
+            try:
+                return get_papers(ids)
+            except ALLOWED_EXCEPTIONS as e:
+                warnings.warn(
+                    f"Failed to retrieve {len(ids)} papers after {n_attempts_per_query} attempts: {e}"
+                )
+                return [None] * len(ids)
+
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            # map preserves the order of chunks
+            for result in executor.map(get_papers_or_nones, chunked_ids):
+                papers.extend(result)
+                pbar.update(len(result))
 
         pbar.close()
 
+        # Realign results with the (possibly repeated) queried ids
+        if len(unique_ids) < len(bibcodes):
+            id_to_paper = dict(zip(unique_ids, papers))
+            papers = [id_to_paper[id] for id in bibcodes]
+
         if not convert:
             return papers
         return self.convert_publications(
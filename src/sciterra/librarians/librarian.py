@@ -1,10 +1,7 @@
 from ..mapping.publication import Publication
 
 from abc import ABC, abstractmethod
-from functools import partial
 from typing import Any
-from multiprocessing import Pool
-from tqdm import tqdm
 
 
 class Librarian(ABC):
@@ -20,6 +17,7 @@ class Librarian(ABC):
         *args,
         call_size: int = None,
         n_attempts_per_query: int = None,
+        num_workers: int = None,
         convert: bool = True,
         **kwargs,
     ) -> list[Publication]:
@@ -29,6 +27,8 @@ class Librarian(ABC):
             n_attempts_per_query: Number of attempts to access the API per query. Useful when experiencing connection issues.
 
             call_size: (int): maximum number of papers to call API for in one query; if less than `len(paper_ids)`, chunking will be performed.
+
+            num_workers: (int): number of chunks to query the API for concurrently.
         """
         raise NotImplementedError
 
@@ -41,32 +41,14 @@ class Librarian(ABC):
         self,
         papers: list,
         *args,
-        multiprocess: bool = True,
-        num_processes=6,
         **kwargs,
     ) -> list[Publication]:
-        """Convet a list of API-specific results to sciterra Publications, possibly using multiprocessing."""
-
-        # TODO: you need to pass args and kwargs into these
-        if not multiprocess:
-            return [
-                self.convert_publication(
-                    paper,
-                    *args,
-                    **kwargs,
-                )
-                for paper in papers
-            ]
-        with Pool(processes=num_processes) as p:
-            publications = list(
-                tqdm(
-                    p.map(
-                        partial(self.convert_publication, *args, **kwargs),
-                        papers,
-                        chunksize=10,
-                    ),
-                    total=len(papers),
-                )
+        """Convert a list of API-specific results to sciterra Publications. Conversion is cheap attribute access, so papers are converted serially."""
+        return [
+            self.convert_publication(
+                paper,
+                *args,
+                **kwargs,
             )
-
-        return publications
+            for paper in papers
+        ]
@@ -1,22 +1,41 @@
 import warnings
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
 
 from typing import Any
 from tqdm import tqdm
 
 
-from sciterra.mapping.publication import Publication
-
 from ..mapping.publication import Publication
 from .librarian import Librarian
-from ..misc.utils import chunk_ids, keep_trying, get_verbose
+from ..misc.utils import chunk_ids, keep_trying, get_verbose, TokenBucket
 
 from semanticscholar import SemanticScholar
+from semanticscholar.ApiRequester import ApiRequester
 from semanticscholar.Paper import Paper
 
+import json
+import orjson
+import sqlite3
+import time
+import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import ReadTimeout, ConnectionError
-from semanticscholar.SemanticScholarException import ObjectNotFoundException
+from semanticscholar.SemanticScholarException import (
+    BadQueryParametersException,
+    ObjectNotFoundException,
+)
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_fixed
+
+##############################################################################
+# Exceptions
+##############################################################################
+
+
+class ServerError(Exception):
+    """Raised when the API responds with a 5xx status, e.g. "Internal Service Error" or "Gateway Timeout", which are typically transient."""
+
 
 ##############################################################################
 # Constants
@@ -54,14 +73,151 @@ EXTERNAL_IDS = [
     "URL",
 ]
 
+# Transient errors, for which queries are retried
 ALLOWED_EXCEPTIONS = (
-    Exception,  # "Internal Service Error"
     ReadTimeout,
     ConnectionError,
+    ConnectionRefusedError,  # 429 Too Many Requests
+    ServerError,
+)
+# Errors for which a chunk of papers is given up on (as Nones), rather than aborting the whole query
+FAILED_QUERY_EXCEPTIONS = ALLOWED_EXCEPTIONS + (
+    BadQueryParametersException,
     ObjectNotFoundException,
 )
-CALL_SIZE = 10
+CALL_SIZE = 100  # batches whose citations or references reach BATCH_LIMIT are split and queried again
+MAX_CALL_SIZE = 500  # the most ids the /paper/batch endpoint accepts per request
+BATCH_LIMIT = 10000  # the most citations (and references) the /paper/batch endpoint returns per request
 NUM_ATTEMPTS_PER_QUERY = 50
+NUM_WORKERS = 4  # number of chunks queried concurrently
+POOL_SIZE = 16  # number of connections to the API kept open for reuse
+CACHE_EXPIRY = (
+    30 * 86400
+)  # seconds before a cached paper is queried again, since citations accrue
+MAX_RETRY_TIME = 600  # seconds to keep retrying a query for
+
+##############################################################################
+# Connection pooling
+##############################################################################
+
+
+class PooledApiRequester(ApiRequester):
+    """An ApiRequester that sends every request through one `requests.Session`, so that connections to the API (and their TLS handshakes) are reused across requests and threads, rather than opened anew for each request."""
+
+    def __init__(self, timeout: int, pool_size: int = POOL_SIZE) -> None:
+        super().__init__(timeout)
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=pool_size))
+
+    # The same as ApiRequester.get_data, except for using self.session, and parsing responses with orjson, which decodes large batch responses several times faster than json.
+    @retry(
+        wait=wait_fixed(30),
+        retry=retry_if_exception_type(ConnectionRefusedError),
+        stop=stop_after_attempt(10),
+        reraise=True,
+    )
+    def get_data(
+        self,
+        url: str,
+        parameters: str,
+        headers: dict,
+        payload: dict = None,
+    ):
+        url = f"{url}?{parameters}"
+        method = "POST" if payload else "GET"
+        payload = json.dumps(payload) if payload else None
+        r = self.session.request(
+            method, url, timeout=self.timeout, headers=headers, data=payload
+        )
+
+        data = {}
+        if r.status_code == 200:
+            data = orjson.loads(r.content)
+            if len(data) == 1 and "error" in data:
+                data = {}
+        elif r.status_code == 400:
+            data = orjson.loads(r.content)
+            raise BadQueryParametersException(data["error"])
+        elif r.status_code == 403:
+            raise PermissionError("HTTP status 403 Forbidden.")
+        elif r.status_code == 404:
+            data = orjson.loads(r.content)
+            raise ObjectNotFoundException(data["error"])
+        elif r.status_code == 429:
+            raise ConnectionRefusedError("HTTP status 429 Too Many Requests.")
+        elif r.status_code >= 500:
+            raise ServerError(f"HTTP status {r.status_code}: {r.text}")
+
+        return data
+
+
+##############################################################################
+# Batching
+##############################################################################
+
+
+def is_truncated(papers: list[Paper]) -> bool:
+    """Check whether the citations or references of a batch of papers may have been truncated by the API, i.e. whether either total reaches BATCH_LIMIT."""
+    papers = [paper for paper in papers if paper is not None]
+    return (
+        sum(len(paper.citations or []) for paper in papers) >= BATCH_LIMIT
+        or sum(len(paper.references or []) for paper in papers) >= BATCH_LIMIT
+    )
+
+
+##############################################################################
+# Caching
+##############################################################################
+
+
+class PaperCache:
+    """A sqlite cache of the raw API data of retrieved papers, keyed by the queried id and fields, so that repeated queries (e.g. across iterative expansions or runs) do not go over the network."""
+
+    def __init__(self, cache_fp: str, expiry: float = CACHE_EXPIRY) -> None:
+        """Open (or create) a paper cache.
+
+        Args:
+            cache_fp: path to the sqlite database file.
+
+            expiry: the number of seconds after which a cached paper is considered stale and queried again.
+        """
+        self.expiry = expiry
+        self.connection = sqlite3.connect(cache_fp, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS papers (paper_id TEXT, fields TEXT, data TEXT, retrieved REAL, PRIMARY KEY (paper_id, fields))"
+            )
+
+    def get(self, paper_ids: list[str], fields: list[str]) -> dict[str, Paper]:
+        """Retrieve the unexpired cached papers for a list of ids, omitting ids that are not cached."""
+        fields = ",".join(fields)
+        oldest = time.time() - self.expiry
+        cached = {}
+        # sqlite limits the number of parameters per statement (999 in older versions)
+        for i in range(0, len(paper_ids), 900):
+            batch = paper_ids[i : i + 900]
+            rows = self.connection.execute(
+                f"SELECT paper_id, data FROM papers WHERE fields = ? AND retrieved > ? AND paper_id IN ({','.join('?' * len(batch))})",
+                [fields, oldest] + batch,
+            )
+            cached.update(
+                {paper_id: Paper(orjson.loads(data)) for paper_id, data in rows}
+            )
+        return cached
+
+    def set(self, papers: dict[str, Paper], fields: list[str]) -> None:
+        """Store retrieved papers, keyed by the ids they were queried with."""
+        fields = ",".join(fields)
+        retrieved = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO papers VALUES (?, ?, ?, ?)",
+                [
+                    (paper_id, fields, orjson.dumps(paper.raw_data), retrieved)
+                    for paper_id, paper in papers.items()
+                ],
+            )
+
 
 ##############################################################################
 # Main librarian class
@@ -73,7 +229,26 @@ class SemanticScholarLibrarian(Librarian):
         self,
         api_key: str = None,
         api_key_fn: str = None,
+        requests_per_second: float = None,
+        burst: int = 1,
+        cache_fp: str = None,
+        cache_expiry: float = CACHE_EXPIRY,
     ) -> None:
+        """Construct a librarian for the Semantic Scholar API.
+
+        Args:
+            api_key: a private S2 API key.
+
+            api_key_fn: path to a file containing a private S2 API key.
+
+            requests_per_second: (if given) limit requests to the API to this many per second on average, across all threads. Throttling on the client side avoids wasting requests (and retry delays) on rate limit errors when querying with many workers. Default is `None`, and requests are not limited.
+
+            burst: the number of requests that may be made at once when `requests_per_second` is given.
+
+            cache_fp: (if given) path to a sqlite database in which to cache retrieved papers, so that papers already retrieved are not queried again. Default is `None`, and papers are not cached.
+
+            cache_expiry: the number of seconds for which a cached paper is reused before it is queried again.
+        """
         if api_key_fn is not None:
             print(f"Reading private api key from {api_key_fn}.")
             # Parse api_key_fn for 40-ch private key
@@ -81,6 +256,15 @@ class SemanticScholarLibrarian(Librarian):
                 api_key = f.read()
 
         self.sch = SemanticScholar(api_key=api_key)
+        self.sch._requester = PooledApiRequester(self.sch.timeout)
+        self.rate_limiter = (
+            TokenBucket(requests_per_second, capacity=burst)
+            if requests_per_second is not None
+            else None
+        )
+        self.cache = (
+            PaperCache(cache_fp, expiry=cache_expiry) if cache_fp is not None else None
+        )
         super().__init__()
 
     def bibtex_entry_identifier(self, bibtex_entry: dict) -> str:
@@ -100,6 +284,7 @@ class SemanticScholarLibrarian(Librarian):
         *args,
         call_size: int = CALL_SIZE,
         n_attempts_per_query: int = NUM_ATTEMPTS_PER_QUERY,
+        num_workers: int = NUM_WORKERS,
         convert: bool = True,
         **kwargs,
     ) -> list[Publication]:
@@ -110,7 +295,9 @@ class SemanticScholarLibrarian(Librarian):
 
             n_attempts_per_query: Number of attempts to access the API per query. Useful when experiencing connection issues.
 
-            call_size: maximum number of papers to call API for in one query; if less than `len(paper_ids)`, chunking will be performed. Maximum that S2 allows is 500.
+            call_size: maximum number of papers to call API for in one query; if less than `len(paper_ids)`, chunking will be performed. Maximum that S2 allows is 500. Since S2 returns at most 10,000 citations (and references) per request, batches that reach this limit are split in half and queried again.
+
+            num_workers: number of chunks to query the API for concurrently. Since network latency dominates retrieval time, overlapping requests in a thread pool substantially reduces wall time; set to 1 to query sequentially.
 
             convert: whether to convert each resulting SemanticScholar Paper to sciterra Publications (True by default).
 
@@ -125,47 +312,104 @@ class SemanticScholarLibrarian(Librarian):
         if call_size is None:
             call_size = CALL_SIZE
 
-        total = len(paper_ids)
-        chunked_ids = chunk_ids(
-            paper_ids,
-            call_size=call_size,
-        )
+        if call_size > MAX_CALL_SIZE:
+            warnings.warn(
+                f"call_size={call_size} exceeds the maximum number of papers S2 returns per batch request; using call_size={MAX_CALL_SIZE}."
+            )
+            call_size = MAX_CALL_SIZE
+
+        if num_workers is None:
+            num_workers = NUM_WORKERS
 
         if None in paper_ids:
             # any Nones should have been handled by this point
             raise Exception("Passed `paper_ids` contains None.")
 
-        print(f"Querying Semantic Scholar for {len(paper_ids)} total papers.")
+        # Query each distinct id only once, preserving order
+        unique_ids = list(dict.fromkeys(paper_ids))
+
+        # Only query the ids missing from the cache
+        cached = {}
+        if self.cache is not None:
+            cached = self.cache.get(unique_ids, QUERY_FIELDS)
+            unique_ids = [id for id in unique_ids if id not in cached]
+            if cached:
+                print(f"Retrieved {len(cached)} papers from cache.")
+
+        total = len(unique_ids)
+        chunked_ids = chunk_ids(
+            unique_ids,
+            call_size=call_size,
+        )
+
+        print(f"Querying Semantic Scholar for {len(unique_ids)} total papers.")
         papers = []
         pbar = tqdm(desc=f"progress using call_size={call_size}", total=total)
-        for ids in chunked_ids:
 
-            @keep_trying(
-                n_attempts=n_attempts_per_query,
-                allowed_exceptions=ALLOWED_EXCEPTIONS,
-                sleep_after_attempt=2,
-            )
-            def get_papers() -> list[Paper]:
-                if call_size > 1:
-                    result = self.get_papers(
-                        paper_ids=ids,
+        @keep_trying(
+            n_attempts=n_attempts_per_query,
+            allowed_exceptions=ALLOWED_EXCEPTIONS,
+            sleep_after_attempt=2,
+            max_time=MAX_RETRY_TIME,
+        )
+        def get_papers(ids: list[str]) -> list[Paper]:
+            if call_size > 1:
+                result = self.get_papers(
+                    paper_ids=ids,
+                    fields=QUERY_FIELDS,
+                )
+            else:
+                # typically completes about 100 queries per minute.
+                result = [
+                    self.get_paper(
+                        paper_id=paper_id,
                         fields=QUERY_FIELDS,
                     )
-                else:
-                    # typically completes about 100 queries per minute.
-                    result = [
-                        self.get_paper(
-                            paper_id=paper_id,
-                            fields=QUERY_FIELDS,
-                        )
-                        for paper_id in ids
-                    ]
-                return result
-
-            papers.extend(get_papers())
-            pbar.update(len(ids))
+                    for paper_id in ids
+                ]
+            return result
+
+        def get_untruncated_papers(ids: list[str]) -> list[Paper]:
+            # bisect batches whose citations or references were cut off, so that large call sizes lose no data
+            result = get_papers(ids)
+            if len(ids) > 1 and is_truncated(result):
+                half = len(ids) // 2
+                return get_untruncated_papers(ids[:half]) + get_untruncated_papers(
+                    ids[half:]
+                )
+            return result
+
+        def get_papers_or_nones(ids: list[str]) -> list[Paper]:
+            # a chunk that still fails after all attempts should not discard the results of the other chunks
+            try:
+                return get_untruncated_papers(ids)
+            except FAILED_QUERY_EXCEPTIONS as e:
+                warnings.warn(f"Failed to retrieve {len(ids)} papers: {e!r}")
+                return [None] * len(ids)
+
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            # map preserves the order of chunks
+            for result in executor.map(get_papers_or_nones, chunked_ids):
+                if self.cache is not None:
+                    ids = unique_ids[len(papers) : len(papers) + len(result)]
+                    self.cache.set(
+                        {
+                            id: paper
+                            for id, paper in zip(ids, result)
+                            if paper is not None
+                        },
+                        QUERY_FIELDS,
+                    )
+                papers.extend(result)
+                pbar.update(len(result))
         pbar.close()
 
+        # Realign results with the (possibly repeated or cached) queried ids
+        if len(unique_ids) < len(paper_ids):
+            id_to_paper = dict(zip(unique_ids, papers))
+            id_to_paper.update(cached)
+            papers = [id_to_paper[id] for id in paper_ids]
+
         if not convert:
             return papers
         return self.convert_publications(  # may contain Nones!
@@ -174,6 +418,23 @@ class SemanticScholarLibrarian(Librarian):
             **kwargs,
         )
 
+    def convert_publications(
+        self, papers: list[Paper], *args, **kwargs
+    ) -> list[Publication]:
+        """See `Librarian.convert_publications`. If verbose, warn once about the publications whose citations list has a different length from citation_count (typically because S2 truncates citations), rather than once per publication."""
+        publications = super().convert_publications(papers, *args, **kwargs)
+        if get_verbose(kwargs):
+            num_mismatched = sum(
+                pub.citation_count != len(pub.citations)
+                for pub in publications
+                if pub is not None
+            )
+            if num_mismatched:
+                warnings.warn(
+                    f"The length of the citations list is different from citation_count for {num_mismatched} of {len(publications)} publications."
+                )
+        return publications
+
     def convert_publication(self, paper: Paper, *args, **kwargs) -> Publication:
         """Convert a SemanticScholar Paper object to a sciterra.publication.Publication."""
         if paper is None:
@@ -195,21 +456,21 @@ class SemanticScholarLibrarian(Librarian):
         # Parse citations
         citations = None
         if paper.citations is not None:
-            # convert citations/references from lists of Papers to identifiers
+            # convert citations/references from lists of Papers to identifiers, reading each paperId once
             citations = [
-                paper.paperId for paper in paper.citations if paper.paperId is not None
+                paper_id
+                for citation in paper.citations
+                if (paper_id := citation.paperId) is not None
             ]  # no point using recursion assuming identifier=paperId
 
         references = [
-            paper.paperId for paper in paper.references if paper.paperId is not None
+            paper_id
+            for reference in paper.references
+            if (paper_id := reference.paperId) is not None
         ]
 
         # TODO: same with citationCount
         citation_count = paper.citationCount
-        if citation_count != len(citations) and verbose:
-            warnings.warn(
-                f"The length of the citations list ({len(citations)}) is different from citation_count ({citation_count})"
-            )
 
         # TODO: What if citations = []?
         if (
@@ -221,14 +482,10 @@ class SemanticScholarLibrarian(Librarian):
             citation_count = len(citations)
 
         # Clobber together a field of study from the validated annoatation or s2's model-predicted fields
-        primary_fields = (
-            paper.fieldsOfStudy
-            if hasattr(paper, "fieldsOfStudy") and paper.fieldsOfStudy is not None
-            else []
-        )
+        primary_fields = paper.fieldsOfStudy if paper.fieldsOfStudy is not None else []
         addl_fields = (
             [entry["category"] for entry in paper.s2FieldsOfStudy]
-            if hasattr(paper, "s2FieldsOfStudy") and paper.s2FieldsOfStudy is not None
+            if paper.s2FieldsOfStudy is not None
             else []
         )
         fields_of_study = primary_fields + addl_fields
@@ -247,9 +504,9 @@ class SemanticScholarLibrarian(Librarian):
             "fields_of_study": fields_of_study,
             # additional fields
             "doi": paper.externalIds["DOI"] if "DOI" in paper.externalIds else None,
-            "url": paper.url if hasattr(paper, "url") else None,
-            "title": paper.title if hasattr(paper, "title") else None,
-            "issn": paper.issn if hasattr(paper, "issn") else None,
+            "url": paper.raw_data.get("url"),
+            "title": paper.title,
+            "issn": paper.raw_data.get("issn"),
         }
         data = {k: v for k, v in data.items() if v is not None}
 
@@ -269,6 +526,8 @@ class SemanticScholarLibrarian(Librarian):
 
         payload = {"ids": paper_ids}
 
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
         data = self.sch._requester.get_data(
             url, parameters, self.sch.auth_header, payload
         )
@@ -290,6 +549,8 @@ class SemanticScholarLibrarian(Librarian):
         fields = ",".join(fields)
         parameters = f"&fields={fields}"
 
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
         data = self.sch._requester.get_data(url, parameters, self.sch.auth_header)
         paper = Paper(data) if data is not None else None  # added condition
 
@@ -5,7 +5,10 @@ import os
 import warnings
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 
+from datetime import date, datetime
 from typing import Any
 
 from .publication import Publication
@@ -14,6 +17,226 @@ from ..misc.utils import read_pickle, write_pickle, get_verbose, custom_formatwa
 
 warnings.formatwarning = custom_formatwarning
 
+PUBLICATIONS_FN = "publications.parquet"  # a directory of part files
+EMBEDDINGS_FN = "embeddings.npy"
+
+
+# Types of the primary publication fields, so that pyarrow does not have to infer them
+FIELD_TYPES = {
+    "identifier": pa.string(),
+    "abstract": pa.string(),
+    "publication_date": pa.string(),  # ISO format
+    "citation_count": pa.int64(),
+    "citations": pa.list_(pa.string()),
+    "references": pa.list_(pa.string()),
+    "fields_of_study": pa.list_(pa.string()),
+}
+
+
+def write_publications(fp: str, publications: list[Publication]) -> None:
+    """Write publications to a zstd-compressed Parquet file, with one row per publication and one column per field."""
+    # Build one list per column in a single pass over the publications
+    columns: dict[str, list] = {}
+    for i, pub in enumerate(publications):
+        for k, v in pub.to_dict().items():
+            if k not in columns:
+                columns[k] = [None] * len(publications)
+            columns[k][i] = v
+
+    if "publication_date" in columns:
+        # ISO strings round-trip both dates (S2) and datetimes (ADS)
+        columns["publication_date"] = [
+            d.isoformat() if d is not None else None
+            for d in columns["publication_date"]
+        ]
+
+    table = pa.table(
+        {k: pa.array(v, type=FIELD_TYPES.get(k)) for k, v in columns.items()}
+    )
+    pq.write_table(table, fp, compression="zstd")
+
+
+def array_to_pylist(array: pa.Array) -> list:
+    """Convert a pyarrow array to a list of Python objects. String arrays are converted through numpy, which is much faster than `pa.Array.to_pylist`."""
+    if pa.types.is_string(array.type):
+        return array.to_numpy(zero_copy_only=False).tolist()
+    return array.to_pylist()
+
+
+def column_to_pylist(column: pa.ChunkedArray) -> list:
+    """Convert a Parquet column to a list of Python objects. List columns (e.g. citations) are converted by slicing their flattened values, which is several times faster than converting each row's list separately."""
+    column = column.combine_chunks()
+    if not pa.types.is_list(column.type):
+        return array_to_pylist(column)
+
+    values = array_to_pylist(column.values)
+    offsets = column.offsets.to_pylist()
+    is_valid = column.is_valid().to_pylist()
+    return [
+        values[start:end] if valid else None
+        for start, end, valid in zip(offsets[:-1], offsets[1:], is_valid)
+    ]
+
+
+def read_publications(fp: str) -> list[Publication]:
+    """Read publications from a Parquet file written by `write_publications`."""
+    table = pq.read_table(fp)
+    columns = {k: column_to_pylist(table.column(k)) for k in table.column_names}
+
+    if "publication_date" in columns:
+        columns["publication_date"] = [
+            (
+                None
+                if date_str is None
+                else (
+                    datetime.fromisoformat(date_str)
+                    if "T" in date_str
+                    else date.fromisoformat(date_str)
+                )
+            )
+            for date_str in columns["publication_date"]
+        ]
+
+    return [
+        Publication({k: v for k, v in zip(columns, row) if v is not None})
+        for row in zip(*columns.values())
+    ]
+
+
+def publication_parts(dirpath: str) -> list[str]:
+    """Get the paths to the Parquet part files of a publications directory, newest first. Reading parts in this order reproduces the order of publications in the saved Atlas, since `Cartographer.expand` places new publications before existing ones."""
+    if not os.path.isdir(dirpath):
+        return []
+    return [
+        os.path.join(dirpath, fn)
+        for fn in sorted(os.listdir(dirpath), reverse=True)
+        if fn.startswith("part-") and fn.endswith(".parquet")
+    ]
+
+
+def save_publications(
+    dirpath: str,
+    publications: list[Publication],
+    incremental: bool = True,
+) -> None:
+    """Save publications to a directory of Parquet part files.
+
+    Args:
+        dirpath: the directory to write part files to.
+
+        publications: the publications to save, in Atlas order.
+
+        incremental: if True, compare the identifiers of `publications` with those already saved, write only the added publications to a new part file, and rewrite only the part files containing removed publications. This requires added publications to precede the saved ones, as after `Cartographer.expand`, and the saved ones to keep their order, as after `Cartographer.filter_by_ids`; otherwise, all publications are rewritten to a single part file.
+    """
+    ids = [pub.identifier for pub in publications]
+    parts = publication_parts(dirpath)
+
+    if incremental and parts:
+        part_ids = {
+            part: pq.read_table(part, columns=["identifier"])
+            .column("identifier")
+            .to_pylist()
+            for part in parts
+        }
+        current_ids = set(ids)
+        saved_ids = {
+            identifier for idents in part_ids.values() for identifier in idents
+        }
+        added = [pub for pub in publications if pub.identifier not in saved_ids]
+        kept_ids = [
+            identifier
+            for idents in part_ids.values()
+            for identifier in idents
+            if identifier in current_ids
+        ]
+        if ids == [pub.identifier for pub in added] + kept_ids:
+            # Rewrite the parts containing removed publications without them
+            for part, idents in part_ids.items():
+                if all(identifier in current_ids for identifier in idents):
+                    continue
+                table = pq.read_table(part)
+                keep = [identifier in current_ids for identifier in idents]
+                os.remove(part)
+                if any(keep):
+                    pq.write_table(
+                        table.filter(pa.array(keep)), part, compression="zstd"
+                    )
+            if added:
+                part_num = int(os.path.basename(parts[0])[5:-8]) + 1
+                write_publications(
+                    os.path.join(dirpath, f"part-{part_num:05d}.parquet"), added
+                )
+            return
+
+    # Full rewrite, e.g. when publications have been reordered
+    if os.path.isfile(dirpath):
+        os.remove(dirpath)  # a single file written by an earlier version
+    os.makedirs(dirpath, exist_ok=True)
+    for part in parts:
+        os.remove(part)
+    if publications:
+        write_publications(os.path.join(dirpath, "part-00000.parquet"), publications)
+
+
+def save_embeddings(
+    fp: str,
+    embeddings: np.ndarray,
+    dtype: str = "float16",
+) -> None:
+    """Save embeddings to a .npy file, which can be memory-mapped on load.
+
+    Args:
+        fp: the .npy file to write to.
+
+        embeddings: array of shape `(num_pubs, embedding_dim)`
+
+        dtype: the dtype to store floating point embeddings as. The default float16 takes a quarter of the space of float64 (half of float32), while changing cosine similarities by a negligible amount. "int8" halves the space again by scaling each embedding to the int8 range; the per-embedding scales are saved alongside (see `scale_filepath`), so that `load_embeddings` restores each embedding to within 1/254 of its largest component. Pass `None` to store embeddings as is.
+    """
+    scale = None
+    if dtype is not None and np.issubdtype(embeddings.dtype, np.floating):
+        if np.dtype(dtype) == np.int8:
+            scale = (
+                np.abs(embeddings).max(axis=1, keepdims=True).astype(np.float32) / 127
+            ).clip(min=1e-12)
+            embeddings = np.rint(embeddings / scale)
+        embeddings = embeddings.astype(dtype, copy=False)
+
+    # Write to temporary files and then replace, since the existing files may be memory-mapped by the atlas being saved
+    if scale is not None:
+        save_array(scale_filepath(fp), scale)
+    elif os.path.exists(scale_filepath(fp)):
+        os.remove(scale_filepath(fp))  # stale scales of earlier int8 embeddings
+    save_array(fp, embeddings)
+
+
+def save_array(fp: str, array: np.ndarray) -> None:
+    """Save an array to a .npy file by writing to a temporary file and then replacing, so that an existing memory map of the file is not clobbered."""
+    fp_tmp = f"{fp}.tmp.npy"
+    np.save(fp_tmp, array)
+    os.replace(fp_tmp, fp)
+
+
+def scale_filepath(fp: str) -> str:
+    """Get the path of the .npy file of per-embedding scales for int8 embeddings saved at `fp`."""
+    return f"{os.path.splitext(fp)[0]}_scale.npy"
+
+
+def load_embeddings(fp: str) -> np.ndarray:
+    """Lazily load embeddings from a .npy file as a read-only memory map. Embeddings saved as int8 are instead dequantized into a float32 array with their saved scales."""
+    embeddings = np.load(fp, mmap_mode="r")
+    if embeddings.dtype == np.int8:
+        return embeddings * np.load(scale_filepath(fp))
+    return embeddings
+
+
+def load_publications(dirpath: str) -> list[Publication]:
+    """Load publications from a directory of Parquet part files written by `save_publications`, or from a single Parquet file."""
+    if os.path.isfile(dirpath):
+        return read_publications(dirpath)
+    return [
+        pub for part in publication_parts(dirpath) for pub in read_publications(part)
+    ]
+
 
 class Atlas:
 
@@ -56,9 +279,10 @@ class Atlas:
         Raises:
             ValueError: the identifier is not in the Atlas.
         """
-        if identifier in self.publications:
+        try:
             return self.publications[identifier]
-        raise ValueError(f"Identifier {identifier} not in Atlas.")
+        except KeyError:
+            raise ValueError(f"Identifier {identifier} not in Atlas.") from None
 
     @property
     def ids(self) -> list[str]:
@@ -73,13 +297,19 @@ class Atlas:
         self,
         atlas_dirpath: str,
         overwrite: bool = True,
+        incremental: bool = True,
+        embeddings_dtype: str = "float16",
     ) -> None:
-        """Write the Atlas to a directory containing a .pkl binary for each attribute.
+        """Write the Atlas to a directory containing a .pkl binary for each attribute, except for publications, which are written to Parquet part files, and the projection embeddings, which are written to a .npy file.
 
         Warnings cannot be silenced.
 
         Args:
             atlas_dirpath: path of directory to save files to.
+
+            incremental: whether to only write publications that were added, and drop those that were removed, since the last save, rather than rewriting all of them. Falls back to a full rewrite when publications have been reordered (see `save_publications`).
+
+            embeddings_dtype: the dtype to store the projection embeddings as; float16 by default. "int8" halves the space of float16, and is dequantized to float32 on load (see `save_embeddings`). Pass `None` to store them in their current dtype.
         """
 
         # Create directory as needed, or overwrite existing files
@@ -108,17 +338,41 @@ class Atlas:
 
         for attribute in attributes:
             if getattr(self, attribute) is not None:
-                # write the list version to be consistent with load and constructor
-                if attribute == "publications":
-                    attributes[attribute] = list(self.publications.values())
-
-                fn = f"{attribute}.pkl"
+                fn = (
+                    PUBLICATIONS_FN
+                    if attribute == "publications"
+                    else f"{attribute}.pkl"
+                )
                 fp = os.path.join(atlas_dirpath, fn)
-                if os.path.isfile(fp):
+                if os.path.exists(fp):
                     warnings.warn(f"Overwriting existing file at {fp}.")
                 else:
                     warnings.warn(f"Writing to {fp}.")
-                write_pickle(fp, attributes[attribute])
+
+                if attribute == "publications":
+                    # skip placeholders for publications a librarian failed to retrieve, which are filtered out on projection anyway
+                    save_publications(
+                        fp,
+                        [pub for pub in self.publications.values() if pub is not None],
+                        incremental=incremental,
+                    )
+                elif attribute == "projection":
+                    # write embeddings separately, and pickle only the identifier mappings
+                    save_embeddings(
+                        os.path.join(atlas_dirpath, EMBEDDINGS_FN),
+                        self.projection.embeddings,
+                        dtype=embeddings_dtype,
+                    )
+                    write_pickle(
+                        fp,
+                        Projection(
+                            identifier_to_index=self.projection.identifier_to_index,
+                            index_to_identifier=self.projection.index_to_identifier,
+                            embeddings=None,
+                        ),
+                    )
+                else:
+                    write_pickle(fp, attributes[attribute])
             else:
                 warnings.warn(f"No {attribute} to save, skipping.")
 
@@ -127,7 +381,7 @@ class Atlas:
         cls,
         atlas_dirpath: str,
     ):
-        """Load an Atlas object from a directory containing the .pkl binary for each attribute.
+        """Load an Atlas object from a directory containing the .pkl binary for each attribute, the Parquet part files of publications and the .npy file of projection embeddings. Embeddings are memory-mapped rather than read into memory. Atlases saved with publications or embeddings in .pkl binaries are still supported.
 
         Warnings cannot be silenced.
 
@@ -146,6 +400,12 @@ class Atlas:
             ]
         }
         for attribute in attributes:
+            if attribute == "publications":
+                fp = os.path.join(atlas_dirpath, PUBLICATIONS_FN)
+                if os.path.exists(fp):
+                    attributes[attribute] = load_publications(fp)
+                    continue
+
             fn = f"{attribute}.pkl"
             fp = os.path.join(atlas_dirpath, fn)
             if os.path.isfile(fp):
@@ -153,6 +413,13 @@ class Atlas:
             else:
                 warnings.warn(f"No {attribute} to read, skipping.")
 
+        projection = attributes["projection"]
+        if projection is not None and projection.embeddings is None:
+            # embeddings are stored separately, except in atlases saved by earlier versions
+            projection.embeddings = load_embeddings(
+                os.path.join(atlas_dirpath, EMBEDDINGS_FN)
+            )
+
         if attributes["publications"] is None:
             warnings.warn("Loading empty atlas.")
             attributes["publications"] = list()
@@ -1,9 +1,10 @@
 """Functions for manipulating an atlas based on the document embeddings of the abstracts of its publications."""
 
 import bibtexparser
-import inspect
 import warnings
 
+from itertools import chain, filterfalse
+
 import numpy as np
 
 from . import topography
@@ -11,12 +12,12 @@ from .atlas import Atlas
 from .publication import Publication
 from ..librarians.librarian import Librarian
 from ..vectorization.vectorizer import Vectorizer
+from ..vectorization.cache import CachedVectorizer
 from ..vectorization.projection import Projection, merge, get_empty_projection
 from ..misc.utils import get_verbose, custom_formatwarning
 
 from typing import Callable, Tuple
 from tqdm import tqdm
-from sklearn.metrics.pairwise import cosine_similarity
 
 warnings.formatwarning = custom_formatwarning
 
@@ -28,7 +29,7 @@ warnings.formatwarning = custom_formatwarning
 def batch_cospsi_matrix(embeddings: np.ndarray) -> np.ndarray:
     """Batch-process a pairwise cosine similarity matrix between embeddings.
 
-    In order to avoid memory errors (e.g. bus error, segfaults) resulting from too large arrays, we batch process the construction of the cospsi_matrix.
+    In order to avoid memory errors (e.g. bus error, segfaults) resulting from too large arrays, we batch process the construction of the cospsi_matrix. Embeddings are normalized once, so that each batch of rows is a single matrix product written directly into the preallocated result, computed in float32 (or the embeddings' dtype, if wider).
 
     Args:
         embeddings: a numpy array of embeddings of shape `(num_pubs, embedding_dim)`
@@ -36,21 +37,27 @@ def batch_cospsi_matrix(embeddings: np.ndarray) -> np.ndarray:
     Returns:
         cosine_similarities: a 2D numpy array of shape `(num_pubs, num_pubs)` representing the pairwise cosine similarity between each embedding
     """
-    batch_size = min(1000, len(embeddings))  # Define a batch size
+    batch_size = max(1, min(1000, len(embeddings)))  # Define a batch size
+
+    embeddings = np.asarray(
+        embeddings, dtype=np.result_type(embeddings.dtype, np.float32)
+    )
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    normalized_embeddings = embeddings / norms.clip(min=1e-12)
 
-    cosine_similarities = None
+    cosine_similarities = np.empty(
+        (len(embeddings), len(embeddings)), dtype=normalized_embeddings.dtype
+    )
     print(
         f"computing cosine similarity for {len(embeddings)} embeddings with batch size {batch_size}."
     )
     for i in tqdm(range(0, len(embeddings), batch_size)):
         # Process batches to compute cosine similarity
-        batch = embeddings[i : i + batch_size]
-        if cosine_similarities is None:
-            cosine_similarities = cosine_similarity(batch, embeddings)
-        else:
-            cosine_similarities = np.vstack(
-                (cosine_similarities, cosine_similarity(batch, embeddings))
-            )
+        np.matmul(
+            normalized_embeddings[i : i + batch_size],
+            normalized_embeddings.T,
+            out=cosine_similarities[i : i + batch_size],
+        )
 
     return cosine_similarities
 
@@ -98,7 +105,31 @@ class Cartographer:
         self,
         librarian: Librarian = None,
         vectorizer: Vectorizer = None,
+        embeddings_cache_fp: str = None,
+        embeddings_cache_model_name: str = None,
     ) -> None:
+        """Construct a Cartographer.
+
+        Args:
+            librarian: the Librarian used to query a bibliographic database API.
+
+            vectorizer: the Vectorizer used to embed abstracts.
+
+            embeddings_cache_fp: (if given) path to a sqlite database in which to cache the embeddings of abstracts, so that abstracts embedded in previous projections or runs are not embedded again (see `CachedVectorizer`). Default is `None`, and embeddings are not cached.
+
+            embeddings_cache_model_name: the name embeddings are cached under, which must identify the model (and configuration) of `vectorizer`, so that embeddings from different models are never mixed in the cache. Required if `embeddings_cache_fp` is given.
+        """
+        if vectorizer is not None and embeddings_cache_fp is not None:
+            if embeddings_cache_model_name is None:
+                raise ValueError(
+                    "Caching embeddings requires an `embeddings_cache_model_name`."
+                )
+            vectorizer = CachedVectorizer(
+                vectorizer,
+                embeddings_cache_fp,
+                model_name=embeddings_cache_model_name,
+            )
+
         self.librarian = librarian
         self.vectorizer = vectorizer
 
@@ -188,12 +219,16 @@ class Cartographer:
         previously_embedded_ids = []
         if atl_filtered.projection is not None:
             previously_embedded_ids = atl_filtered.projection.identifier_to_index
-        embed_ids = [
-            id for id in atl_filtered.publications if id not in previously_embedded_ids
+        embed_pubs = [
+            pub
+            for id, pub in atl_filtered.publications.items()
+            if id not in previously_embedded_ids
         ]
+        # object arrays keep the (interned) identifier strings themselves, and allow selection by index arrays
+        embed_ids = np.array([pub.identifier for pub in embed_pubs], dtype=object)
 
         fail_ids = set()
-        if embed_ids:
+        if len(embed_ids):
             if verbose:
                 if atl_filtered.projection is not None:
                     warnings.warn(
@@ -203,14 +238,17 @@ class Cartographer:
 
             # Embed documents
             result = self.vectorizer.embed_documents(
-                [atl_filtered[id].abstract for id in embed_ids],
+                [pub.abstract for pub in embed_pubs],
                 batch_size=kwargs["batch_size"] if "batch_size" in kwargs else None,
             )
             embeddings = result["embeddings"]
             success_indices = result["success_indices"]
             fail_indices = result["fail_indices"]
 
-            # get new set of bad ids
+            success_ids = embed_ids[success_indices].tolist()
+            fail_ids = set(embed_ids[fail_indices].tolist())
+
+            # get new set of bad ids, so that failed publications are not retrieved and embedded again in future expansions
             atl_filtered.bad_ids = atl_filtered.bad_ids.union(fail_ids)
 
             if fail_indices.tolist() and verbose:
@@ -218,20 +256,14 @@ class Cartographer:
                     f"Failed to get embeddings for all {len(embed_ids)} publications; only {len(embeddings)} will be added to the Atlas. There are now {len(atl_filtered.bad_ids)} total ids that will be excluded in the future."
                 )
 
-            embed_ids_array = np.array(embed_ids)
-            success_ids = embed_ids_array[success_indices]
-            fail_ids = set(embed_ids_array[fail_indices])
-
             # create new projection
             projection = Projection(
-                identifier_to_index={
-                    identifier: idx for idx, identifier in enumerate(success_ids)
-                },
+                identifier_to_index=dict(zip(success_ids, range(len(success_ids)))),
                 index_to_identifier=tuple(success_ids),
                 embeddings=embeddings,
             )
 
-        if not embed_ids or embed_ids is None and verbose:
+        if not len(embed_ids):
             warnings.warn(f"Obtained no new publication embeddings.")
             projection = get_empty_projection()
 
@@ -258,6 +290,7 @@ class Cartographer:
         self,
         atl: Atlas,
         center: str,
+        k: int = None,
     ) -> Tuple[list[str], list[str]]:
         """Sort an atlas according to cosine similarity to a center publication.
         Like numpy argsort, this returns identifiers that can be used to
@@ -268,6 +301,8 @@ class Cartographer:
 
             center: center the search on this publication
 
+            k: (if given) return only the `k` publications most similar to the center. This avoids sorting the entire atlas when only the nearest publications are needed. Default is `None`, and all publications are returned.
+
         Returns:
             sorted_keys: keys in descending order of similarity to the center publication
             sorted_values: values in descending order of similarity to the center publication
@@ -282,16 +317,22 @@ class Cartographer:
                 )
 
         if len(atl.projection):
-            # build cosine similarity matrix, of shape (1, num_pubs)
-            cospsi_matrix = cosine_similarity(
-                atl.projection.identifiers_to_embeddings([center]),
-                atl.projection.embeddings,
+            # cosine similarity to the center is a single matrix-vector product of the (cached) unit-norm embeddings, of shape (num_pubs,)
+            normalized_embeddings = atl.projection.normalized_embeddings
+            cospsi = (
+                normalized_embeddings
+                @ normalized_embeddings[atl.projection.identifier_to_index[center]]
             )
             # get most similar keys from center, including center itself
-            sort_inds = np.argsort(cospsi_matrix)[-1][::-1]
+            if k is not None and k < len(cospsi):
+                # partition out the k most similar, and sort only those
+                top_inds = np.argpartition(cospsi, -k)[len(cospsi) - k :]
+                sort_inds = top_inds[np.argsort(cospsi[top_inds])[::-1]]
+            else:
+                sort_inds = np.argsort(cospsi)[::-1]
             # argsort orders from least to greatest similarity, so reverse
             sorted_keys = atl.projection.indices_to_identifiers(sort_inds)
-            sorted_values = cospsi_matrix[0][sort_inds]
+            sorted_values = cospsi[sort_inds]
 
             return sorted_keys, sorted_values
 
@@ -329,23 +370,29 @@ class Cartographer:
         # Get the keys to expand
         expand_keys = None
         if center is not None:
-            expand_keys = self.sort(atl, center)[0]
+            expand_keys = self.sort(atl, center, k=n_sources_max)[0]
 
         # If that didn't work, just use all the keys
-        existing_keys = set(atl.ids)
         if expand_keys is None:
-            expand_keys = existing_keys
+            expand_keys = atl.ids
 
         if n_sources_max is not None:
             expand_keys = expand_keys[:n_sources_max]
 
+        # Prune for obvious overlap, and for ids that have previously failed; build this set once rather than for every publication
+        excluded_ids = atl.publications.keys() | atl.bad_ids
+
         # Get identifiers for the expansion
         # For each publication corresponding to an id in `expand_keys`, collect the ids corresponding to the publication's references and citations.
         ids = set()
         for key in expand_keys:
-            ids_i = set(atl[key].references + atl[key].citations)
-            # Prune for obvious overlap, and for ids that have previously failed
-            ids.update(ids_i - existing_keys - atl.bad_ids)
+            pub = atl[key]
+            # stream the ids not yet excluded, rather than building a concatenated list and a set for each publication
+            ids.update(
+                filterfalse(
+                    excluded_ids.__contains__, chain(pub.references, pub.citations)
+                )
+            )
             # Break when the search is centered and we're maxed out
             if len(ids) > n_pubs_max and center is not None:
                 break
@@ -356,7 +403,11 @@ class Cartographer:
 
         # Sample to account for max number of publications we want to retrieve
         if len(ids) > n_pubs_max:
-            ids = np.random.choice(ids, n_pubs_max, replace=False)
+            # sample indices rather than the ids themselves, to avoid copying the ids into a numpy array
+            ids = [
+                ids[idx]
+                for idx in np.random.choice(len(ids), n_pubs_max, replace=False)
+            ]
 
         print(f"Expansion will include {len(ids)} new publications.")
 
@@ -448,6 +499,7 @@ class Cartographer:
                 "You must pass exactly one of `keep_ids` or `drop_ids`, but both had a value that was not `None`."
             )
         if keep_ids is not None:
+            keep_ids = set(keep_ids)
             filter_ids = set([id for id in atl.ids if id not in keep_ids])
         elif drop_ids is not None:
             filter_ids = set(drop_ids)
@@ -463,22 +515,16 @@ class Cartographer:
         if atl.projection is None:
             new_projection = None
         else:
-            filter_indices = set()
+            keep = np.ones(len(atl.projection.index_to_identifier), dtype=bool)
             idx_to_id_new = []
             # From indexing
             for idx, id in enumerate(atl.projection.index_to_identifier):
                 if id in filter_ids:
-                    filter_indices.add(idx)
+                    keep[idx] = False
                 else:
                     idx_to_id_new.append(id)
-            # From embeddings
-            embeddings = np.array(
-                [
-                    embedding
-                    for idx, embedding in enumerate(atl.projection.embeddings)
-                    if idx not in filter_indices
-                ]
-            )
+            # From embeddings, copying the kept rows in one slice
+            embeddings = atl.projection.embeddings[keep]
             # From identifier to index map
             id_to_idx_new = {id: idx for idx, id in enumerate(idx_to_id_new)}
             # Construct new, filtered projection
@@ -534,9 +580,9 @@ class Cartographer:
         # Skip expensive convergence calculation if possible
         kernel_size = self.converged_kernel_size(atl) if calculate_convergence else None
         atl.history = {
-            "pubs_per_update": self.pubs_per_update
-            if pubs_per_update is None
-            else pubs_per_update,
+            "pubs_per_update": (
+                self.pubs_per_update if pubs_per_update is None else pubs_per_update
+            ),
             "kernel_size": kernel_size,
         }
         return atl
@@ -606,16 +652,14 @@ class Cartographer:
                 "Incomplete update history as indicated by entries with values of -2."
             )
 
-        publications = np.array(atl.ids)
-
         # Compute pairwise cosine similarity, shape `(num_pubs,num_pubs)`
         cospsi_matrix = batch_cospsi_matrix(atl.projection.embeddings)
 
         # 0. Loop over each publication
         cospsi_kernel: list[list[int]] = []
-        for pub in tqdm(publications, desc="calculating converged kernel size"):
+        for idx in tqdm(range(len(atl)), desc="calculating converged kernel size"):
             # 1. Identify the similarity with the other publications relative to this publication, and sort accordingly.
-            cospsi = cospsi_matrix[publications == pub].flatten()  # shape `(num_pubs,)`
+            cospsi = cospsi_matrix[idx]  # shape `(num_pubs,)`
             sort_inds = np.argsort(cospsi)[::-1]  # shape `(num_pubs,)`
 
             # 2. Identify the expansion iteration at which those publications were added to the atlas (`sorted_history`).
@@ -649,6 +693,7 @@ class Cartographer:
         metrics: list[str] = ["density"],
         min_prior_pubs: int = 2,
         kernel_size=16,
+        batch_size: int = 1000,
         **kwargs,
     ):
         """Measure topographic properties of all publications relative to prior
@@ -677,6 +722,8 @@ class Cartographer:
 
             kernel_size: the number of publications surrounding the publication for which to compute the topography metric, i.e. k nearest neighbors for k=kernel_size.
 
+            batch_size: the number of publications to measure at once.
+
         Returns:
             estimates: an np.ndarray of shape `(len(publication_indices), len(metrics))` representing the estimated topography metric values for each publication.
         """
@@ -691,63 +738,46 @@ class Cartographer:
         if not ids:
             raise Exception("No publications to measure topography of.")
 
-        # Get publication dates, for filtering
-        dates = np.array([atl[identifier].publication_date for identifier in ids])
+        # Get publication dates, for filtering, as datetime64 so that comparisons are vectorized
+        dates = np.array(
+            [atl[identifier].publication_date for identifier in ids],
+            dtype="datetime64[us]",
+        )
 
-        # Get pairwise cosine similarities for ids
-        embeddings = atl.projection.identifiers_to_embeddings(ids)
-        cospsi_matrix = batch_cospsi_matrix(embeddings)
+        # Get embeddings for ids, normalized so that cosine similarities are dot products
+        indices = atl.projection.identifiers_to_indices(ids)
+        embeddings = atl.projection.embeddings[indices]
+        normalized_embeddings = atl.projection.normalized_embeddings[indices]
 
         # From here on, use embedding indices instead of identifiers
         # our embeddings are already in the correct order, so just use them
         publication_indices = np.arange(len(embeddings))
 
+        for metric in metrics:
+            if metric not in topography.BATCH_METRICS:
+                raise ValueError(f"Unknown topography metric {metric}.")
+
         print(f"Computing {metrics} for {len(ids)} publications.")
-        estimates = []
-        for idx, identifier in tqdm(enumerate(ids), total=len(ids)):
-            # Get the date of publication
-            date = atl[identifier].publication_date
-
-            # Identify prior publications
-            is_prior = dates < date
-            if is_prior.sum() < min_prior_pubs:
-                estimates.append([np.nan for _ in metrics])
-                continue
-
-            # Choose valid publications
-            is_other = publication_indices != idx
-            is_valid = is_prior & is_other
-            valid_indices = publication_indices[is_valid]
-
-            kwargs = {
-                "idx": idx,
-                "cospsi_matrix": cospsi_matrix,
-                "valid_indices": valid_indices,
-                "publication_indices": publication_indices,
-                "embeddings": embeddings,
-                "kernel_size": kernel_size,
-            }
-
-            def call_metric(
-                metric: str,
-                **kwargs,
-            ) -> float:
-                """Wrapper function to simplify topography metric api."""
-                # Get the metric
-                fn = getattr(topography, f"{metric}_metric")
-
-                # Identify arguments to pass
-                fn_args = inspect.getfullargspec(fn)
-                used_kwargs = {}
-                for key, value in kwargs.items():
-                    if key in fn_args.args:
-                        used_kwargs[key] = value
-                # Call
-                estimate = fn(**used_kwargs)
-                return estimate
-
-            estimates.append([call_metric(metric, **kwargs) for metric in metrics])
-
-        estimates = np.array(estimates)
+
+        # Measure a batch of publications at a time with array operations
+        estimates = np.empty((len(ids), len(metrics)))
+        for start in tqdm(range(0, len(ids), batch_size)):
+            idx = publication_indices[start : start + batch_size]
+
+            # Identify prior publications, which excludes the publication itself
+            is_prior = dates[np.newaxis, :] < dates[idx, np.newaxis]
+
+            # Compute only this batch's rows of the pairwise cosine similarity matrix, so that the full matrix is never held in memory
+            cospsi = normalized_embeddings[idx] @ normalized_embeddings.T
+
+            estimates[idx] = topography.batch_metrics(
+                metrics,
+                idx,
+                cospsi,
+                is_prior,
+                embeddings,
+                kernel_size=kernel_size,
+            )
+            estimates[idx[is_prior.sum(axis=1) < min_prior_pubs]] = np.nan
 
         return estimates
@@ -1,5 +1,6 @@
 """The general container for data for any scientific publication, regardless of the API that was used to obtain it."""
 
+import sys
 import warnings
 from datetime import date
 from ..misc.utils import get_verbose, custom_formatwarning
@@ -59,6 +60,17 @@ class Publication:
             An int corresponding to the number of citations received by the publication
     """
 
+    # Publications are stored by the hundreds of thousands in large atlases, so we declare slots rather than giving each one a __dict__.
+    __slots__ = [
+        "_identifier",
+        "_abstract",
+        "_publication_date",
+        "_citation_count",
+        "_fields_of_study",
+        "_citations",
+        "_references",
+    ] + ADDITIONAL_FIELDS
+
     def __init__(self, data: dict, **kwargs) -> None:
         """Construct a publication.
 
@@ -108,25 +120,52 @@ class Publication:
         return "sciterra.publication.Publication:{}".format(self.identifier)
 
     def __str__(self) -> str:
-        return self.identifier
+        return self._identifier
 
     def __hash__(self) -> int:
-        return hash(self.__dict__.values())
+        return hash(self.identifier)
 
     def __eq__(self, __value: object) -> bool:
-        return self.__dict__ == __value.__dict__
+        return self.__getstate__() == __value.__getstate__()
 
     def __lt__(self, __value: object) -> bool:
         return str(self) < str(__value)
 
+    def to_dict(self) -> dict:
+        """Get the data dict that reconstructs this publication, i.e. `Publication(pub.to_dict()) == pub`. Unset attributes are omitted."""
+        data = {
+            "identifier": self.identifier,
+            "abstract": self.abstract,
+            "publication_date": self.publication_date,
+            "citation_count": self.citation_count,
+            "citations": self.citations,
+            "references": self.references,
+            "fields_of_study": self.fields_of_study,
+        }
+        data = {k: v for k, v in data.items() if v is not None}
+        data.update(
+            {k: getattr(self, k) for k in ADDITIONAL_FIELDS if hasattr(self, k)}
+        )
+        return data
+
+    def __getstate__(self) -> dict:
+        """Get the attributes that are set, keyed by name."""
+        return {k: getattr(self, k) for k in self.__slots__ if hasattr(self, k)}
+
+    def __setstate__(self, state: dict) -> None:
+        """Restore the attributes from `__getstate__`. This also accepts the `__dict__` of publications pickled before slots were declared."""
+        for k, v in state.items():
+            setattr(self, k, v)
+
     def init_attributes(self, data, **kwargs) -> None:
+        """Validate and store data. Identifiers, including those of citations and references, are interned: the same ids recur across many publications' citations and references and as Atlas keys, so interning stores each id once and lets dict and set lookups match by identity."""
         verbose = get_verbose(kwargs)
 
         if "identifier" in data:
             val = data["identifier"]
             if not isinstance(val, str):
                 raise ValueError
-            self._identifier = val
+            self._identifier = sys.intern(str(val))
 
         if "abstract" in data:
             val = data["abstract"]
@@ -144,7 +183,7 @@ class Publication:
             val = data["citations"]
             if not isinstance(val, list):
                 raise ValueError
-            self._citations = val
+            self._citations = [sys.intern(str(identifier)) for identifier in val]
         else:
             self._citations = []
 
@@ -152,7 +191,7 @@ class Publication:
             val = data["references"]
             if not isinstance(val, list):
                 raise ValueError
-            self._references = val
+            self._references = [sys.intern(str(identifier)) for identifier in val]
         else:
             self._references = []
 
@@ -180,5 +219,6 @@ class Publication:
         # Other attributes
         ######################################################################
 
-        data_copy = {k: v for k, v in data.items() if k in ADDITIONAL_FIELDS}
-        self.__dict__.update(data_copy)
+        for k in ADDITIONAL_FIELDS:
+            if k in data:
+                setattr(self, k, data[k])
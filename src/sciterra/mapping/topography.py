@@ -30,19 +30,9 @@ def smoothing_length_metric(
         h: float representing arc length containing `kernel_size` other publications. (Assumes normalized to a radius of 1.)
     """
 
-    # We can't have the kernel larger than the number of valid publications
-    if kernel_size > len(valid_indices):
-        return np.nan
-
-    # Get 1D array of similarity scores to idx vector
-    cospsi = cospsi_matrix[idx][valid_indices]
-
-    # Get cosine distance to the least similar vector
-    # np.sort orders from least to greatest similarity, so reverse after
-    cospsi_max = np.sort(cospsi)[::-1][kernel_size - 1]
-
-    # Compute arclength to furthest vector
-    return np.arccos(cospsi_max)
+    return publication_metric(
+        "smoothing_length", idx, cospsi_matrix, valid_indices, kernel_size=kernel_size
+    )
 
 
 def density_metric(
@@ -67,14 +57,10 @@ def density_metric(
         density: a float representing `kernel_size` divided by arc length containing `kernel_size` other publications.
     """
 
-    h = smoothing_length_metric(idx, cospsi_matrix, valid_indices, kernel_size)
-    density = kernel_size / h
-
     # # TODO: there is serious numerical instability for BOW methods. Not sure what the most principled way to deal with them are.
-    # if density > 1e7 and np.isfinite(density):
-    #     breakpoint()
-
-    return density
+    return publication_metric(
+        "density", idx, cospsi_matrix, valid_indices, kernel_size=kernel_size
+    )
 
 
 ########################################################################
@@ -109,16 +95,14 @@ def edginess_metric(
         a float representing the normalized magnitude of the asymmetry metric.
 
     """
-    return (
-        kernel_constant_asymmetry_metric(
-            idx,
-            cospsi_matrix,
-            valid_indices,
-            publication_indices,
-            embeddings,
-            kernel_size=kernel_size,
-        )
-        / kernel_size
+    return publication_metric(
+        "edginess",
+        idx,
+        cospsi_matrix,
+        valid_indices,
+        publication_indices,
+        embeddings,
+        kernel_size=kernel_size,
     )
 
 
@@ -151,21 +135,118 @@ def kernel_constant_asymmetry_metric(
         mag: a float representing the magnitude of the asymmetry metric.
     """
 
+    return publication_metric(
+        "kernel_constant_asymmetry",
+        idx,
+        cospsi_matrix,
+        valid_indices,
+        publication_indices,
+        embeddings,
+        kernel_size=kernel_size,
+    )
+
+
+########################################################################
+# Batched metrics
+########################################################################
+
+BATCH_METRICS = [
+    "smoothing_length",
+    "density",
+    "edginess",
+    "kernel_constant_asymmetry",
+]
+
+
+def batch_metrics(
+    metrics: list[str],
+    idx: np.ndarray,
+    cospsi: np.ndarray,
+    valid: np.ndarray,
+    embeddings: np.ndarray,
+    kernel_size: int = 16,
+) -> np.ndarray:
+    """Compute topography metrics for a batch of publications at once, equivalent to calling the corresponding `{metric}_metric` function for each publication.
+
+    Args:
+        metrics: the metrics to compute; each must be in `BATCH_METRICS`.
+
+        idx: an np.ndarray of shape `(batch_size,)` representing the indices of the vectors to calculate the measurements for.
+
+        cospsi: an np.ndarray of shape `(batch_size, num_pubs)` representing the rows of the pairwise cosine similarity matrix for the batch.
+
+        valid: a boolean np.ndarray of shape `(batch_size, num_pubs)` indicating, for each publication in the batch, the other publications used when calculating the measurements.
+
+        embeddings: an np.ndarray of shape `(num_pubs, embedding_dim)` vectors for all publications in the atlas projection
+
+        kernel_size: number of K nearest neighbors to calculate the measurements on.
+
+    Returns:
+        estimates: an np.ndarray of shape `(batch_size, len(metrics))`; NaN where there are fewer than `kernel_size` valid publications.
+    """
+    estimates = np.full((len(idx), len(metrics)), np.nan)
+
     # We can't have the kernel larger than the number of valid publications
-    if kernel_size > len(valid_indices):
-        return np.nan
-
-    # Input
-    cospsi = cospsi_matrix[idx][valid_indices]
-    sorted_inds = np.argsort(cospsi)[::-1][:kernel_size]
-    other_inds = publication_indices[valid_indices][sorted_inds]
-    embedding = embeddings[idx]
-    other_embeddings = embeddings[other_inds]
-
-    # Differences
-    diff = embedding - other_embeddings
-    diff_mag = np.linalg.norm(diff, axis=1)
-    result = (diff / diff_mag[:, np.newaxis]).sum(axis=0)
-    mag = np.linalg.norm(result)
-
-    return mag
+    has_kernel = valid.sum(axis=1) >= kernel_size
+    if not has_kernel.any():
+        return estimates
+    idx = idx[has_kernel]
+    cospsi = np.where(valid[has_kernel], cospsi[has_kernel], -np.inf)
+
+    # Get the kernel_size most similar valid publications, in no particular order
+    kernel_inds = np.argpartition(-cospsi, kernel_size - 1, axis=1)[:, :kernel_size]
+
+    # Compute arclength to furthest vector in the kernel
+    if {"smoothing_length", "density"} & set(metrics):
+        cospsi_max = np.take_along_axis(cospsi, kernel_inds, axis=1).min(axis=1)
+        h = np.arccos(cospsi_max)
+
+    # Differences between each publication and those in its kernel
+    if {"edginess", "kernel_constant_asymmetry"} & set(metrics):
+        # Upcast to at least float32 before differencing, since low precision (e.g. float16) embeddings lose accuracy
+        dtype = np.result_type(embeddings.dtype, np.float32)
+        embedding = embeddings[idx].astype(dtype)[:, np.newaxis]
+        diff = embedding - embeddings[kernel_inds].astype(dtype)
+        diff_mag = np.linalg.norm(diff, axis=2)
+        mag = np.linalg.norm((diff / diff_mag[..., np.newaxis]).sum(axis=1), axis=1)
+
+    for i, metric in enumerate(metrics):
+        if metric == "smoothing_length":
+            estimates[has_kernel, i] = h
+        elif metric == "density":
+            estimates[has_kernel, i] = kernel_size / h
+        elif metric == "edginess":
+            estimates[has_kernel, i] = mag / kernel_size
+        elif metric == "kernel_constant_asymmetry":
+            estimates[has_kernel, i] = mag
+        else:
+            raise ValueError(f"No batched implementation of metric {metric}.")
+
+    return estimates
+
+
+def publication_metric(
+    metric: str,
+    idx: int,
+    cospsi_matrix: np.ndarray,
+    valid_indices: np.ndarray,
+    publication_indices: np.ndarray = None,
+    embeddings: np.ndarray = None,
+    kernel_size: int = 16,
+) -> float:
+    """Compute a topography metric for a single publication with `batch_metrics`. See the corresponding `{metric}_metric` function for the arguments; `embeddings` (and `publication_indices`) are only needed for the asymmetry metrics."""
+    # Pass batch_metrics only the valid similarities, and the embeddings of the corresponding publications followed by that of idx
+    cospsi = cospsi_matrix[idx][valid_indices][np.newaxis]
+    valid = np.ones_like(cospsi, dtype=bool)
+    if embeddings is not None:
+        other_inds = publication_indices[valid_indices]
+        embeddings = embeddings[np.append(other_inds, idx)]
+
+    return batch_metrics(
+        [metric],
+        np.array([len(valid_indices)]),
+        cospsi,
+        valid,
+        embeddings,
+        kernel_size=kernel_size,
+    )[0, 0]
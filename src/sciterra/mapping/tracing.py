@@ -259,7 +259,7 @@ class AtlasTracer:
             atl_center = self.cartographer.bibtex_to_atlas(bibtex_fp)
             atl_center = self.cartographer.project(atl_center)
 
-            num_entries = len(atl_center.publications.values())
+            num_entries = len(atl_center)
             if num_entries > 1:
                 raise Exception(
                     f"To build out a centered atlas, the center is specified by loading a bibtex file with a single entry. Found {num_entries} entries in {bibtex_fp}"
@@ -1,8 +1,12 @@
 """Miscellaneous helper functions."""
 
 import pickle
+import random
+import threading
 import time
 from functools import wraps
+from itertools import islice
+from typing import Iterable, Iterator
 from requests.exceptions import ReadTimeout, ConnectionError
 
 # For Bibtex parsing
@@ -53,6 +57,8 @@ def keep_trying(
     allowed_exceptions=(ReadTimeout, ConnectionError),
     verbose=True,
     sleep_after_attempt=1,
+    max_sleep=30,
+    max_time=600,
 ):
     """Sometimes we receive server errors. We don't want that to disrupt the entire process, so this decorator allow trying n_attempts times.
 
@@ -67,7 +73,13 @@ def keep_trying(
             Allowed exception class. Set to BaseException to keep trying regardless of exception.
 
         sleep_after_attempt (int):
-            Number of seconds to wait before trying each additional attempt.
+            Base number of seconds to wait after a failed attempt. The wait after the i-th failure is drawn uniformly from [0, sleep_after_attempt * 2**i] ("full jitter"), so that concurrent callers that fail together (e.g. on a rate limit) back off exponentially and do not all retry at the same instant.
+
+        max_sleep (int):
+            Maximum number of seconds to wait after any failed attempt.
+
+        max_time (int):
+            Maximum number of seconds to keep trying for, including time spent in attempts; once waiting for another attempt would exceed it, the exception is raised. Set to None to only limit the number of attempts.
 
         verbose (bool):
             If True, be talkative.
@@ -81,11 +93,9 @@ def keep_trying(
     def _keep_trying(f):
         @wraps(f)
         def wrapped_fn(*args, **kwargs):
+            start = time.monotonic()
             # Loop over for n-1 attempts, trying to return
             for i in range(n_attempts - 1):
-                # waiting may help with connection errors?
-                time.sleep(sleep_after_attempt)
-
                 try:
                     result = f(*args, **kwargs)
                     if i > 0 and verbose:
@@ -93,7 +103,20 @@ def keep_trying(
                     return result
                 # TODO: need to branch for every case.
                 except allowed_exceptions as _:
-                    continue
+                    # waiting may help with connection errors?
+                    sleep = random.uniform(
+                        0, min(max_sleep, sleep_after_attempt * 2**i)
+                    )
+                    if (
+                        max_time is not None
+                        and time.monotonic() - start + sleep > max_time
+                    ):
+                        if verbose:
+                            print(
+                                f"Gave up calling {f} after {i+1} attempts in {max_time} seconds."
+                            )
+                        raise
+                    time.sleep(sleep)
 
             # On last attempt just let it be
             if verbose:
@@ -107,20 +130,51 @@ def keep_trying(
     return _keep_trying
 
 
-def chunk_ids(ids: list[str], call_size):
-    """Helper function to chunk bibcodes or paperIds into smaller sublists if appropriate."""
+def chunk_ids(ids: Iterable[str], call_size) -> Iterator[list[str]]:
+    """Helper function to chunk bibcodes or paperIds into smaller sublists if appropriate. Chunks are yielded one at a time rather than materialized as a list of lists; no chunks are yielded for no ids."""
     # Break into chunks
     assert (  # TODO: this seems like an irrelevant copypasta since we use SearchQuery
         call_size <= 2000
     ), "Max number of calls ExportQuery can handle at a time is 2000."
-    if len(ids) > call_size:
-        chunked_ids = [ids[i : i + call_size] for i in range(0, len(ids), call_size)]
-    else:
-        chunked_ids = [
-            ids,
-        ]
+    it = iter(ids)
+    while chunk := list(islice(it, call_size)):
+        yield chunk
+
 
-    return chunked_ids
+class TokenBucket:
+    """A thread-safe token bucket, for limiting the rate of API requests on the client side rather than reacting to rate limit errors.
+
+    Tokens are refilled continuously at `rate` per second, up to `capacity`; each request takes one token, waiting until one is available. This allows bursts of up to `capacity` requests, and `rate` requests per second on average.
+    """
+
+    def __init__(self, rate: float, capacity: int = 1) -> None:
+        """Construct a full token bucket.
+
+        Args:
+            rate: the number of tokens refilled per second, i.e. the steady-state number of requests per second.
+
+            capacity: the maximum number of tokens, i.e. the number of requests that may be made at once.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: int = 1) -> None:
+        """Take `tokens` tokens from the bucket, blocking until they are available."""
+        with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.last) * self.rate
+                )
+                self.last = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                # holding the lock while waiting keeps waiting threads in line
+                time.sleep((tokens - self.tokens) / self.rate)
 
 
 # File IO
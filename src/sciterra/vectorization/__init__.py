@@ -3,6 +3,7 @@ from .scibert import SciBERTVectorizer
 from .sbert import SBERTVectorizer
 from .word2vec import Word2VecVectorizer
 from .bow import BOWVectorizer
+from .cache import CachedVectorizer
 
 vectorizers = {
     "GPT2": GPT2Vectorizer,
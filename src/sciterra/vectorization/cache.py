@@ -0,0 +1,103 @@
+"""A persistent cache of document embeddings, keyed by the content of each document, so that abstracts are only embedded once across atlases and runs."""
+
+import hashlib
+import sqlite3
+
+import numpy as np
+
+from .vectorizer import Vectorizer
+
+# sqlite limits the number of parameters per statement (999 in older versions)
+QUERY_SIZE = 900
+
+
+class CachedVectorizer(Vectorizer):
+    def __init__(
+        self,
+        vectorizer: Vectorizer,
+        cache_fp: str,
+        model_name: str,
+    ) -> None:
+        """Wrap a vectorizer so that document embeddings are stored in (and reused from) a sqlite database.
+
+        Args:
+            vectorizer: the Vectorizer used to embed documents that are not yet cached.
+
+            cache_fp: path to the sqlite database file, which is created if it does not exist.
+
+            model_name: the name embeddings are cached under, so that embeddings from different models are never mixed. It must identify both the model and any configuration affecting its embeddings, e.g. "scibert" or "word2vec-astro_1-dim300"; vectorizers of the same class can produce different embeddings, so there is no default.
+        """
+        self.vectorizer = vectorizer
+        self.model_name = model_name
+
+        self.connection = sqlite3.connect(cache_fp, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, embedding BLOB)"
+            )
+        super().__init__()
+
+    def document_key(self, doc: str) -> str:
+        """Get the cache key of a document, i.e. the model name and the SHA-256 hash of its text."""
+        return f"{self.model_name}:{hashlib.sha256(doc.encode()).hexdigest()}"
+
+    def get_cached(self, keys: list[str]) -> dict[str, np.ndarray]:
+        """Retrieve the cached embeddings for a list of keys, omitting keys that are not cached."""
+        cached = {}
+        for i in range(0, len(keys), QUERY_SIZE):
+            batch = keys[i : i + QUERY_SIZE]
+            rows = self.connection.execute(
+                f"SELECT key, embedding FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                batch,
+            )
+            cached.update(
+                {key: np.frombuffer(blob, dtype=np.float32) for key, blob in rows}
+            )
+        return cached
+
+    def embed_documents(
+        self, docs: list[str], batch_size: int = None
+    ) -> dict[str, np.ndarray]:
+        """Embed a list of documents, only passing those not already cached to the wrapped vectorizer. See `Vectorizer.embed_documents`; embeddings are returned as float32."""
+        keys = [self.document_key(doc) for doc in docs]
+        cached = self.get_cached(list(set(keys)))
+
+        # Embed the documents missing from the cache
+        miss_indices = np.array(
+            [idx for idx, key in enumerate(keys) if key not in cached], dtype=int
+        )
+        fail_indices = np.array([], dtype=int)
+        if len(miss_indices):
+            result = self.vectorizer.embed_documents(
+                [docs[idx] for idx in miss_indices],
+                batch_size=batch_size,
+            )
+            embeddings = np.asarray(result["embeddings"], dtype=np.float32)
+            fail_indices = miss_indices[result["fail_indices"]]
+
+            new = {
+                keys[idx]: embedding
+                for idx, embedding in zip(
+                    miss_indices[result["success_indices"]], embeddings
+                )
+            }
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO embeddings VALUES (?, ?)",
+                    [(key, embedding.tobytes()) for key, embedding in new.items()],
+                )
+            cached.update(new)
+
+        # Assemble the embeddings in the order of docs
+        success_indices = np.array(
+            [idx for idx, key in enumerate(keys) if key in cached], dtype=int
+        )
+        return {
+            "embeddings": (
+                np.stack([cached[keys[idx]] for idx in success_indices])
+                if len(success_indices)
+                else np.empty((0, 0), dtype=np.float32)
+            ),
+            "success_indices": success_indices,
+            "fail_indices": fail_indices,
+        }
@@ -67,7 +67,7 @@ class GPT2Vectorizer(Vectorizer):
         if batch_size is None:
             batch_size = BATCH_SIZE
 
-        embeddings = []
+        embeddings = np.empty((len(docs), EMBEDDING_DIM), dtype=np.float32)
 
         pbar = tqdm(
             total=len(docs),
@@ -96,9 +96,9 @@ class GPT2Vectorizer(Vectorizer):
             for k, v in encoded.items():
                 encoded[k] = v.to(self.device)
 
-            # Run the text through SciBERT,
+            # Run the text through GPT-2,
             # collecting all of the hidden states produced from all 12 layers.
-            with torch.no_grad():
+            with torch.inference_mode():
                 outputs = self.model(  # discard logits
                     **encoded,
                 )
@@ -109,39 +109,31 @@ class GPT2Vectorizer(Vectorizer):
             # shape [batch_size, sequence_length, hidden_size=768]
             last_hidden_state = outputs.last_hidden_state
 
-            # Get the varying sequence lengths,
+            # Get the varying sequence lengths, i.e. up to and including the first padding token if there is one,
             # shape [batch_size,]
-            sequence_lengths = torch.tensor(
-                [
-                    torch.nonzero(token_ids.eq(self.tokenizer.pad_token_id))[0].item()
-                    + 1
-                    if token_ids.eq(self.tokenizer.pad_token_id).any()
-                    else len(token_ids)
-                    for token_ids in input_ids
-                ]
+            is_pad = input_ids.eq(self.tokenizer.pad_token_id)
+            sequence_lengths = torch.where(
+                is_pad.any(dim=1),
+                is_pad.int().argmax(dim=1) + 1,
+                input_ids.size()[-1],
             )
 
             # Get embeddings of each final token,
             # shape [batch_size, hidden_size]
-            last_hidden_states = torch.stack(
-                [
-                    last_hidden_state[i, sequence_lengths[i] - 1, :]
-                    for i in range(len(sequence_lengths))
-                ]
-            )
-
-            # Move to the CPU and convert to numpy ndarray
-            batched_embeddings = last_hidden_states.detach().cpu().numpy()
+            last_hidden_states = last_hidden_state[
+                torch.arange(len(sequence_lengths), device=self.device),
+                sequence_lengths.to(self.device) - 1,
+            ]
 
-            # Collect batched embeddings
-            embeddings.extend(batched_embeddings)
+            # Move to the CPU, convert to numpy ndarray and collect batched embeddings
+            embeddings[i : i + len(batch)] = last_hidden_states.cpu().float().numpy()
 
-            pbar.update(batch_size)
+            pbar.update(len(batch))
         pbar.close()
 
         # We don't deal with OOV, so we always return full list of ids
         return {
-            "embeddings": np.array(embeddings),
+            "embeddings": embeddings,
             "success_indices": np.arange(len(embeddings), dtype=int),
             "fail_indices": np.array([], dtype=int),
         }
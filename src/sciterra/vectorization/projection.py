@@ -17,12 +17,27 @@ class Projection:
 
             index_to_identifier: a tuple mapping embedding indices to Publication identifiers.
 
-            embeddings: ndarray of document embeddings of shape `(num_pubs, embedding_dim)`
+            embeddings: ndarray of document embeddings of shape `(num_pubs, embedding_dim)`. Stored in C (row-major) order, copying only if necessary, so that each document embedding is a contiguous row for similarity computations.
         """
+        if embeddings is not None and not embeddings.flags.c_contiguous:
+            embeddings = np.ascontiguousarray(embeddings)
         self.identifier_to_index = identifier_to_index
         self.index_to_identifier = index_to_identifier
         self.embeddings = embeddings
 
+    @property
+    def normalized_embeddings(self) -> np.ndarray:
+        """The document embeddings scaled to unit L2 norm, so that cosine similarities are plain dot products. Computed once and cached until `self.embeddings` is replaced."""
+        if getattr(self, "_normalized_from", None) is not self.embeddings:
+            embeddings = np.asarray(
+                self.embeddings,
+                dtype=np.result_type(self.embeddings.dtype, np.float32),
+            )
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            self._normalized_embeddings = embeddings / norms.clip(min=1e-12)
+            self._normalized_from = self.embeddings
+        return self._normalized_embeddings
+
     def indices_to_identifiers(self, indices) -> list[str]:
         """Retrieve the identifiers for a list of embedding matrix indices."""
         return [self.index_to_identifier[index] for index in indices]
@@ -69,14 +84,8 @@ def merge(proj_a: Projection, proj_b: Projection) -> Projection:
             indices_missing.append(idx)
             identifiers_missing.append(id)
 
-    # Get just the missing embeddings
-    embeddings_missing = np.array(
-        [
-            embedding
-            for idx, embedding in enumerate(proj_b.embeddings)
-            if idx in set(indices_missing)
-        ]
-    )
+    # Get just the missing embeddings, selecting their rows in one slice
+    embeddings_missing = proj_b.embeddings[np.array(indices_missing, dtype=int)]
 
     # Concatenate index mapping and embeddings
     idx_to_ids_new = identifiers_missing
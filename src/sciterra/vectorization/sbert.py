@@ -8,7 +8,6 @@ Links:
 import torch
 import numpy as np
 from .vectorizer import Vectorizer
-from tqdm import tqdm
 
 from sentence_transformers import SentenceTransformer
 
@@ -54,29 +53,17 @@ class SBERTVectorizer(Vectorizer):
         if batch_size is None:
             batch_size = BATCH_SIZE
 
-        embeddings = []
-
-        pbar = tqdm(
-            total=len(docs),
-            desc="embedding documents",
-            leave=True,
+        # Encode all documents in one call, which sorts them by length so that each batch is padded only up to the length of similarly long documents
+        embeddings = self.model.encode(
+            docs,
+            batch_size=batch_size,
+            show_progress_bar=True,
+            convert_to_numpy=True,
         )
 
-        for i in range(0, len(docs), batch_size):
-            batch = docs[i : min(len(docs), i + batch_size)]
-
-            # no need to convert anything or dig inside model for outputs
-            batched_embeddings = self.model.encode(batch)
-
-            # Collect batched embeddings
-            embeddings.extend(batched_embeddings)
-
-            pbar.update(batch_size)
-        pbar.close()
-
         # We don't have to deal with OOV, so we always return full list of ids
         return {
-            "embeddings": np.array(embeddings),
+            "embeddings": embeddings,
             "success_indices": np.arange(len(embeddings), dtype=int),
             "fail_indices": np.array([], dtype=int),
         }
@@ -8,6 +8,7 @@ Links:
 
 import torch
 import numpy as np
+from functools import lru_cache
 from .vectorizer import Vectorizer
 from tqdm import tqdm
 
@@ -25,22 +26,108 @@ EMBEDDING_DIM = 768
 BATCH_SIZE = 64
 
 
-class SciBERTVectorizer(Vectorizer):
-    def __init__(self, device="cuda", **kwargs) -> None:
-        # Get tokenizer
-        # TODO: does this include the SCIVOCAB or BASEVOCAB?
-        self.tokenizer = BertTokenizerFast.from_pretrained(
-            MODEL_PATH,
-            do_lower_case=True,
-            model_max_length=512,  # I shouldn't have to pass this but I do
+class _CLSEmbedder(torch.nn.Module):
+    """Thin wrapper around the SciBERT classifier that returns only the [CLS] vector of the last hidden layer. Taking positional tensors and returning a single tensor keeps the module traceable by `torch.jit.trace`."""
+
+    def __init__(self, model: torch.nn.Module) -> None:
+        super().__init__()
+        self.model = model
+
+    def forward(
+        self, input_ids: torch.Tensor, attention_mask: torch.Tensor
+    ) -> torch.Tensor:
+        # discard logits, collecting all of the hidden states produced from all 12 layers
+        _, encoded_layers = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            return_dict=False,
         )
-        # Get the model
-        self.model = AutoModelForSequenceClassification.from_pretrained(
-            pretrained_model_name_or_path=MODEL_PATH,
-            output_attentions=False,
-            output_hidden_states=True,
+        # index last (13th) BERT layer before the classifier, then the first token of sequence, [CLS], for our document embeddings
+        return encoded_layers[12][:, 0, :]  # [batch_size, 768]
+
+
+@lru_cache(maxsize=None)
+def load_embedder(
+    device: torch.device,
+    half_precision: bool = False,
+    quantize: bool = False,
+    torchscript: bool = False,
+) -> tuple[BertTokenizerFast, torch.nn.Module, torch.nn.Module]:
+    """Load the SciBERT tokenizer and model, prepared for inference on `device`.
+
+    Results are cached, so that every SciBERTVectorizer constructed with the same arguments in a process shares one copy of the (~440MB) weights instead of reloading them.
+
+    Returns:
+        a tuple of the tokenizer, the model, and the module mapping `(input_ids, attention_mask)` to [CLS] embeddings.
+    """
+    # Get tokenizer
+    # TODO: does this include the SCIVOCAB or BASEVOCAB?
+    tokenizer = BertTokenizerFast.from_pretrained(
+        MODEL_PATH,
+        do_lower_case=True,
+        model_max_length=512,  # I shouldn't have to pass this but I do
+    )
+    # Get the model
+    model = AutoModelForSequenceClassification.from_pretrained(
+        pretrained_model_name_or_path=MODEL_PATH,
+        output_attentions=False,
+        output_hidden_states=True,
+    )
+    model.to(device)
+
+    if half_precision:
+        model.half()
+
+    if quantize:
+        # store the weights of linear layers as int8, and quantize activations on the fly
+        model = torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
         )
 
+    # Put the model in "evaluation" mode
+    model.eval()
+
+    embedder = _CLSEmbedder(model).eval()
+    if torchscript:
+        example = tokenizer(
+            ["example document"],
+            add_special_tokens=True,
+            return_tensors="pt",
+        )
+        with torch.no_grad():
+            embedder = torch.jit.freeze(
+                torch.jit.trace(
+                    embedder,
+                    (
+                        example["input_ids"].to(device),
+                        example["attention_mask"].to(device),
+                    ),
+                )
+            )
+
+    return tokenizer, model, embedder
+
+
+class SciBERTVectorizer(Vectorizer):
+    def __init__(
+        self,
+        device="cuda",
+        half_precision: bool = True,
+        quantize: bool = False,
+        torchscript: bool = False,
+        **kwargs,
+    ) -> None:
+        """Construct a SciBERT document vectorizer. The model is loaded once per process and shared between vectorizers constructed with the same arguments.
+
+        Args:
+            device: the device to run the model on, either 'cuda' (falls back to cpu if unavailable) or 'mps'.
+
+            half_precision: whether to run inference in float16 when on a GPU or MPS device. This roughly halves memory use and speeds up the forward pass, with negligible effect on cosine similarities. Ignored on cpu.
+
+            quantize: whether to apply dynamic int8 quantization to the linear layers of the model when on cpu, which typically speeds up cpu inference by about 2x at a small cost in embedding accuracy (cosine similarity to unquantized embeddings of about 0.999; activations are quantized per batch, so embeddings also vary slightly with batch composition). Ignored on GPU or MPS devices, which quantized kernels do not support.
+
+            torchscript: whether to compile the model with `torch.jit.trace` and freeze it for inference, which removes Python overhead from the forward pass.
+        """
         # set device to GPU
         if device == "mps":
             self.device = MPS_DEVICE
@@ -48,10 +135,12 @@ class SciBERTVectorizer(Vectorizer):
             self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
         print(f"Using device: {self.device}.")
-        self.model.to(self.device)
-
-        # Put the model in "evaluation" mode
-        self.model.eval()
+        self.tokenizer, self.model, self.embedder = load_embedder(
+            self.device,
+            half_precision=half_precision and self.device.type in ("cuda", "mps"),
+            quantize=quantize and self.device.type == "cpu",
+            torchscript=torchscript,
+        )
         super().__init__()
 
     def embed_documents(
@@ -69,7 +158,25 @@ class SciBERTVectorizer(Vectorizer):
         if batch_size is None:
             batch_size = BATCH_SIZE
 
-        embeddings = []
+        embeddings = np.empty((len(docs), EMBEDDING_DIM), dtype=np.float32)
+
+        # Tokenize all documents once, without padding
+        all_input_ids = (
+            self.tokenizer(
+                docs,
+                add_special_tokens=True,
+                truncation=True,  # max length 512 tokens, unfortunately
+                return_attention_mask=False,
+                return_token_type_ids=False,
+            )["input_ids"]
+            if docs
+            else []
+        )
+
+        # Sort documents by token length, so that each batch is padded only up to the length of similarly long abstracts
+        order = np.argsort(
+            [len(input_ids) for input_ids in all_input_ids], kind="stable"
+        )
 
         pbar = tqdm(
             total=len(docs),
@@ -78,49 +185,43 @@ class SciBERTVectorizer(Vectorizer):
         )
 
         for i in range(0, len(docs), batch_size):
-            batch = docs[i : min(len(docs), i + batch_size)]
+            batch_indices = order[i : i + batch_size]
 
-            # Tokenize the batch
-            encoded = self.tokenizer(
-                batch,
-                add_special_tokens=True,
-                padding=True,  # pad up to length of longest abstract
-                truncation=True,  # max length 512 chars, unfortunately
+            # Pad the batch up to the length of its longest abstract
+            encoded = self.tokenizer.pad(
+                {"input_ids": [all_input_ids[idx] for idx in batch_indices]},
+                padding="longest",
+                return_attention_mask=True,
                 return_tensors="pt",
             )
             # each encoded item of shape [64, 512]
             assert encoded["input_ids"].size()[-1] <= 512
 
-            # Put data on GPU
+            # Put data on GPU, copying asynchronously from page-locked memory when possible
             for k, v in encoded.items():
-                encoded[k] = v.to(self.device)
-
-            # Run the text through SciBERT,
-            # collecting all of the hidden states produced from all 12 layers.
-            with torch.no_grad():
-                _, encoded_layers = self.model(  # discard logits
-                    **encoded,
-                    return_dict=False,
+                if self.device.type == "cuda":
+                    v = v.pin_memory()
+                encoded[k] = v.to(self.device, non_blocking=True)
+
+            # Run the text through SciBERT and extract the [CLS] embeddings
+            with torch.inference_mode():
+                batched_embeddings = self.embedder(
+                    encoded["input_ids"],
+                    encoded["attention_mask"],
                 )
 
-            # Extract the embeddings
-            # index last (13th) BERT layer before the classifier
-            final_hidden_state = encoded_layers[12]  # [batch_size, seq_len, 768]
-            # index first token of sequence, [CLS], for our document embeddings
-            batched_embeddings = final_hidden_state[:, 0, :]  # [batch_size, 768]
-
-            # Move to the CPU and convert to numpy ndarray
-            batched_embeddings = batched_embeddings.detach().cpu().numpy()
+            # Move to the CPU and convert to float32 numpy ndarray
+            batched_embeddings = batched_embeddings.detach().cpu().float().numpy()
 
-            # Collect batched embeddings
-            embeddings.extend(batched_embeddings)
+            # Collect batched embeddings, restoring the original order of docs
+            embeddings[batch_indices] = batched_embeddings
 
-            pbar.update(batch_size)
+            pbar.update(len(batch_indices))
         pbar.close()
 
         # We don't deal with OOV, so we always return full list of ids
         return {
-            "embeddings": np.array(embeddings),
+            "embeddings": embeddings,
             "success_indices": np.arange(len(embeddings), dtype=int),
             "fail_indices": np.array([], dtype=int),
         }
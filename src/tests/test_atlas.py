@@ -1,11 +1,17 @@
 """Test basic Atlas functionality, independently of API. To obtain realistic publication data, should probably read in a .bib file."""
 
 import bibtexparser
+import os
 
+import numpy as np
 import pandas as pd
 
+from datetime import date, datetime
+
 from sciterra.mapping.atlas import Atlas
+from sciterra.mapping.cartography import Cartographer
 from sciterra.mapping.publication import Publication
+from sciterra.vectorization.projection import Projection
 
 from sciterra.misc.utils import write_pickle, read_pickle
 
@@ -90,6 +96,193 @@ class TestAtlasDummy:
         atl_loaded = Atlas.load(path)
         assert atl.publications == atl_loaded.publications
 
+    def test_save_load_atlas_full_publications(self, tmp_path):
+        path = tmp_path / atlas_10_dir
+        path.mkdir()
+
+        pubs = [
+            Publication(
+                {
+                    "identifier": "s2_id",
+                    "abstract": "An abstract.",
+                    "publication_date": date(2020, 3, 1),
+                    "citation_count": 2,
+                    "citations": ["id_0", "id_1"],
+                    "references": [],
+                    "fields_of_study": ["Physics"],
+                    "doi": "10.0000/example",
+                    "title": "A title",
+                }
+            ),
+            Publication(
+                {
+                    "identifier": "ads_id",
+                    "publication_date": datetime(2019, 1, 1),
+                    "references": ["id_2"],
+                }
+            ),
+        ]
+        atl = Atlas(pubs)
+        atl.save(path)
+
+        atl_loaded = Atlas.load(path)
+        assert atl.publications == atl_loaded.publications
+        assert atl_loaded.ids == atl.ids
+
+    def test_save_load_atlas_incremental(self, tmp_path):
+        path = tmp_path / atlas_10_dir
+        path.mkdir()
+
+        pubs = [Publication({"identifier": f"id_{i}"}) for i in range(10)]
+        atl = Atlas(pubs[5:])
+        atl.save(path)
+
+        # expanded atlases place new publications first
+        atl = Atlas(pubs[:5] + list(atl.publications.values()))
+        atl.save(path)
+        assert len(os.listdir(path / "publications.parquet")) == 2
+
+        atl_loaded = Atlas.load(path)
+        assert atl_loaded.publications == atl.publications
+        assert atl_loaded.ids == atl.ids
+
+        # removing publications rewrites only the parts that contain them
+        part_0 = path / "publications.parquet" / "part-00000.parquet"
+        mtime_0 = os.stat(part_0).st_mtime_ns
+        atl = Atlas(pubs[:3] + pubs[5:])
+        atl.save(path)
+        assert sorted(os.listdir(path / "publications.parquet")) == [
+            "part-00000.parquet",
+            "part-00001.parquet",
+        ]
+        assert os.stat(part_0).st_mtime_ns == mtime_0
+
+        atl_loaded = Atlas.load(path)
+        assert atl_loaded.publications == atl.publications
+        assert atl_loaded.ids == atl.ids
+
+        # reordering publications requires a full rewrite
+        atl = Atlas(pubs[5:] + pubs[:3])
+        atl.save(path)
+        assert len(os.listdir(path / "publications.parquet")) == 1
+
+        atl_loaded = Atlas.load(path)
+        assert atl_loaded.ids == atl.ids
+
+    def test_save_load_atlas_expand_filter(self, tmp_path):
+        path = tmp_path / atlas_10_dir
+        path.mkdir()
+
+        pubs = [Publication({"identifier": f"id_{i}"}) for i in range(20)]
+        atl = Atlas(pubs[15:])
+        atl.save(path)
+
+        # each iteration expands, then filters out some saved publications
+        for start in [10, 5, 0]:
+            atl = Atlas(pubs[start : start + 5] + list(atl.publications.values()))
+            atl = Atlas(
+                [
+                    pub
+                    for pub in atl.publications.values()
+                    if int(pub.identifier[3:]) % 5 != start // 5 + 1
+                ]
+            )
+            atl.save(path)
+
+            atl_loaded = Atlas.load(path)
+            assert atl_loaded.publications == atl.publications
+            assert atl_loaded.ids == atl.ids
+
+        # the filtered out publications were dropped without a full rewrite
+        assert len(os.listdir(path / "publications.parquet")) == 4
+
+    def test_save_load_atlas_failed_publications(self, tmp_path):
+        path = tmp_path / atlas_10_dir
+        path.mkdir()
+
+        # librarians return None for publications that could not be retrieved
+        pubs = [Publication({"identifier": f"id_{i}"}) for i in range(10)]
+        atl = Atlas(pubs + [None])
+        atl.save(path)
+
+        atl_loaded = Atlas.load(path)
+        assert atl_loaded.ids == [str(pub) for pub in pubs]
+
+    def test_save_load_atlas_projection(self, tmp_path):
+        path = tmp_path / atlas_10_dir
+        path.mkdir()
+
+        pubs = [Publication({"identifier": f"id_{i}"}) for i in range(10)]
+        ids = [str(pub) for pub in pubs]
+        projection = Projection(
+            identifier_to_index={id: idx for idx, id in enumerate(ids)},
+            index_to_identifier=tuple(ids),
+            embeddings=np.random.default_rng(0).random((10, 768), dtype=np.float32),
+        )
+        atl = Atlas(pubs, projection)
+
+        atl.save(path, embeddings_dtype=None)
+        atl_loaded = Atlas.load(path)
+        assert atl_loaded == atl
+        assert isinstance(atl_loaded.projection.embeddings, np.memmap)
+
+        # float16 by default
+        atl.save(path)
+        atl_loaded = Atlas.load(path)
+        assert atl_loaded.projection.embeddings.dtype == np.float16
+        assert np.allclose(
+            atl_loaded.projection.embeddings, projection.embeddings, atol=1e-3
+        )
+
+        # int8 is dequantized with the saved per-embedding scales
+        atl.save(path, embeddings_dtype="int8")
+        atl_loaded = Atlas.load(path)
+        assert atl_loaded.projection.embeddings.dtype == np.float32
+        assert np.allclose(
+            atl_loaded.projection.embeddings, projection.embeddings, atol=1 / 254
+        )
+
+        # saving another dtype removes the scales
+        atl.save(path)
+        atl_loaded = Atlas.load(path)
+        assert not os.path.exists(path / "embeddings_scale.npy")
+        assert atl_loaded.projection.embeddings.dtype == np.float16
+
+    def test_save_load_atlas_topography(self, tmp_path):
+        path = tmp_path / atlas_10_dir
+        path.mkdir()
+
+        num_pubs = 200
+        pubs = [
+            Publication(
+                {
+                    "identifier": f"id_{i}",
+                    "publication_date": date(2000 + i % 20, 1, 1),
+                }
+            )
+            for i in range(num_pubs)
+        ]
+        ids = [str(pub) for pub in pubs]
+        projection = Projection(
+            identifier_to_index={id: idx for idx, id in enumerate(ids)},
+            index_to_identifier=tuple(ids),
+            embeddings=np.random.default_rng(0).normal(1, 1, (num_pubs, 768)),
+        )
+        atl = Atlas(pubs, projection)
+
+        crt = Cartographer()
+        metrics = ["edginess", "density"]
+        expected = crt.measure_topography(atl, metrics=metrics, kernel_size=4)
+        assert np.isfinite(expected).any()
+
+        # int8 rounding moves each component by up to half a quantization step
+        for embeddings_dtype, rtol in [("float16", 1e-3), ("int8", 5e-2)]:
+            atl.save(path, embeddings_dtype=embeddings_dtype)
+            actual = crt.measure_topography(
+                Atlas.load(path), metrics=metrics, kernel_size=4
+            )
+            assert np.allclose(actual, expected, rtol=rtol, equal_nan=True)
+
 
 class TestAtlasCitationNetwork:
 
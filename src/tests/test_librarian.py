@@ -1,7 +1,8 @@
 """Test basic pipeline functionality with each librarian."""
 
-from sciterra.librarians import adslibrarian, s2librarian
+from types import SimpleNamespace
 
+from sciterra.librarians import adslibrarian, s2librarian
 
 ##############################################################################
 # Semantic Scholar
@@ -77,6 +78,136 @@ class TestSemanticScholarLibrarian:
         assert all([pub.identifier == paper_id for pub in pubs])
 
 
+class FakeRequester:
+    """Serves S2 batch requests from a dict of paper data rather than the network, recording the ids of each request."""
+
+    def __init__(self, papers: dict[str, dict]) -> None:
+        self.papers = papers
+        self.requests = []
+
+    def get_data(self, url, parameters, headers, payload=None):
+        self.requests.append(payload["ids"])
+        return [self.papers.get(paper_id) for paper_id in payload["ids"]]
+
+
+def mock_s2librarian(papers: dict[str, dict], **kwargs):
+    librarian = s2librarian.SemanticScholarLibrarian(**kwargs)
+    librarian.sch._requester = FakeRequester(papers)
+    return librarian
+
+
+s2_papers = {
+    f"id_{i}": {"paperId": f"paper_{i}", "citations": [], "references": []}
+    for i in range(10)
+}
+
+
+class TestSemanticScholarCache:
+    def test_cache_hit_miss(self, tmp_path):
+        cache_fp = tmp_path / "papers.sqlite"
+        ids = list(s2_papers)
+
+        librarian = mock_s2librarian(s2_papers, cache_fp=cache_fp)
+        librarian.get_publications(ids[:4], convert=False)
+        papers = librarian.get_publications(ids, convert=False)
+
+        # only the misses are queried, and the hits are placed in order
+        assert librarian.sch._requester.requests == [ids[:4], ids[4:]]
+        assert [paper.paperId for paper in papers] == [
+            s2_papers[paper_id]["paperId"] for paper_id in ids
+        ]
+
+    def test_cache_persistence(self, tmp_path):
+        cache_fp = tmp_path / "papers.sqlite"
+        ids = list(s2_papers)
+
+        mock_s2librarian(s2_papers, cache_fp=cache_fp).get_publications(
+            ids, convert=False
+        )
+
+        # a new librarian reuses the cache, without querying
+        librarian = mock_s2librarian(s2_papers, cache_fp=cache_fp)
+        papers = librarian.get_publications(ids, convert=False)
+        assert librarian.sch._requester.requests == []
+        assert [paper.raw_data for paper in papers] == list(s2_papers.values())
+
+        # unless the cached papers have expired
+        librarian = mock_s2librarian(s2_papers, cache_fp=cache_fp, cache_expiry=-1)
+        librarian.get_publications(ids, convert=False)
+        assert librarian.sch._requester.requests == [ids]
+
+    def test_cache_failed_lookups_not_cached(self, tmp_path):
+        cache_fp = tmp_path / "papers.sqlite"
+        ids = ["id_0", "id_missing"]
+
+        librarian = mock_s2librarian(s2_papers, cache_fp=cache_fp)
+        papers = librarian.get_publications(ids, convert=False)
+        assert papers[1] is None
+
+        papers = librarian.get_publications(ids, convert=False)
+        assert librarian.sch._requester.requests == [ids, ["id_missing"]]
+        assert papers[0].paperId == "paper_0" and papers[1] is None
+
+
+class TruncatingRequester(FakeRequester):
+    """Truncates the citations of a batch to BATCH_LIMIT in total, like the S2 API."""
+
+    def get_data(self, url, parameters, headers, payload=None):
+        data = super().get_data(url, parameters, headers, payload)
+        budget = s2librarian.BATCH_LIMIT
+        truncated = []
+        for item in data:
+            citations = item["citations"][:budget]
+            budget -= len(citations)
+            truncated.append(dict(item, citations=citations))
+        return truncated
+
+
+class TestSemanticScholarBisect:
+    def test_bisect_truncated_batch(self, monkeypatch):
+        monkeypatch.setattr(s2librarian, "BATCH_LIMIT", 10)
+        papers = {
+            f"id_{i}": {
+                "paperId": f"paper_{i}",
+                "citations": [{"paperId": f"citation_{i}_{j}"} for j in range(3)],
+                "references": [],
+            }
+            for i in range(8)
+        }
+        ids = list(papers)
+
+        librarian = s2librarian.SemanticScholarLibrarian()
+        librarian.sch._requester = TruncatingRequester(papers)
+        result = librarian.get_publications(ids, call_size=8, convert=False)
+
+        # batches are halved until their citations fit under BATCH_LIMIT
+        requests = librarian.sch._requester.requests
+        assert [len(request) for request in requests] == [8, 4, 2, 2, 4, 2, 2]
+
+        # and reassembled in order, without truncated citations
+        assert [paper.raw_data for paper in result] == list(papers.values())
+
+
+class TestSemanticScholarDuplicates:
+    def test_duplicate_ids(self):
+        ids = ["id_1", "id_0", "id_1", "id_2", "id_0"]
+
+        librarian = mock_s2librarian(s2_papers)
+        papers = librarian.get_publications(ids, call_size=2, convert=False)
+
+        # each distinct id is queried once, and its paper placed at each of its positions
+        requests = librarian.sch._requester.requests
+        assert sorted(id for request in requests for id in request) == [
+            "id_0",
+            "id_1",
+            "id_2",
+        ]
+        assert [paper.paperId for paper in papers] == [
+            s2_papers[paper_id]["paperId"] for paper_id in ids
+        ]
+        assert papers[0] is papers[2] and papers[1] is papers[4]
+
+
 ##############################################################################
 # ADS
 ##############################################################################
@@ -150,3 +281,80 @@ class TestADSLibrarian:
 
         assert len(pubs) == 100
         assert all([pub.identifier == bibcode for pub in pubs])
+
+
+class FakeSearchQuery:
+    """Serves ADS queries from a list of articles rather than the network, recording the query of each request. Supports queries of one identifier, and the batched OR query of bibcodes."""
+
+    articles = [
+        SimpleNamespace(
+            bibcode=f"2020Test.{i}", identifier=[f"2020Alias.{i}", f"10.1/{i}"]
+        )
+        for i in range(10)
+    ]
+    queries = []
+
+    def __init__(self, query_dict: dict) -> None:
+        FakeSearchQuery.queries.append(query_dict)
+        query = query_dict["q"]
+        if query.startswith("bibcode:("):
+            ids = [id.strip('"') for id in query[len("bibcode:(") : -1].split(" OR ")]
+            # ADS does not return results in the order of the query, nor for aliases
+            self.results = [
+                article for article in self.articles[::-1] if article.bibcode in ids
+            ]
+        else:
+            id = query.split(":", 1)[1] if query.startswith("doi:") else query
+            self.results = [
+                article
+                for article in self.articles
+                if id == article.bibcode or id in article.identifier
+            ][: query_dict["rows"]]
+
+    def __iter__(self):
+        return iter(self.results)
+
+
+class TestADSBatchQuery:
+    def test_batch_query(self, monkeypatch):
+        monkeypatch.setattr(adslibrarian.ads, "SearchQuery", FakeSearchQuery)
+        FakeSearchQuery.queries = []
+        ids = ["2020Test.3", "2020Test.1", "2020Test.7"]
+
+        articles = adslibrarian.ADSLibrarian().get_publications(ids, convert=False)
+
+        # one query for the chunk, realigned to the order of ids
+        assert len(FakeSearchQuery.queries) == 1
+        assert FakeSearchQuery.queries[0]["rows"] == len(ids)
+        assert [article.bibcode for article in articles] == ids
+
+    def test_batch_query_fallback(self, monkeypatch):
+        monkeypatch.setattr(adslibrarian.ads, "SearchQuery", FakeSearchQuery)
+        FakeSearchQuery.queries = []
+        ids = ["2020Test.2", "2020Alias.5", "doi:10.1/8", "2020Missing"]
+
+        articles = adslibrarian.ADSLibrarian().get_publications(ids, convert=False)
+
+        # bibcodes missing from the batched query, and other identifiers, are queried separately
+        assert [query["q"] for query in FakeSearchQuery.queries[1:]] == ids[1:]
+        assert all(query["rows"] == 1 for query in FakeSearchQuery.queries[1:])
+        assert [article and article.bibcode for article in articles] == [
+            "2020Test.2",
+            "2020Test.5",
+            "2020Test.8",
+            None,
+        ]
+
+    def test_duplicate_ids(self, monkeypatch):
+        monkeypatch.setattr(adslibrarian.ads, "SearchQuery", FakeSearchQuery)
+        FakeSearchQuery.queries = []
+        ids = ["2020Test.1", "2020Test.0", "2020Test.1", "2020Test.2", "2020Test.0"]
+
+        articles = adslibrarian.ADSLibrarian().get_publications(
+            ids, call_size=2, convert=False
+        )
+
+        # each distinct id is queried once, and its article placed at each of its positions
+        assert sorted(query["rows"] for query in FakeSearchQuery.queries) == [1, 2]
+        assert [article.bibcode for article in articles] == ids
+        assert articles[0] is articles[2] and articles[1] is articles[4]
@@ -1,5 +1,6 @@
 """Test the basic publication wrapper."""
 
+import pickle
 import pytest
 
 from datetime import datetime
@@ -33,3 +34,18 @@ class TestPublication:
         assert pub.citation_count == 0
         assert pub.url == "exampleurl.com"
         assert not hasattr(pub, "extra")
+
+    def test_pickle_publication(self):
+        data = {
+            "identifier": "exampleidentifierstring",
+            "abstract": "Example abstract text.",
+            "publication_date": datetime.today().date(),
+            "citation_count": 0,
+            "url": "exampleurl.com",
+        }
+        pub = Publication(data)
+
+        pub_loaded = pickle.loads(pickle.dumps(pub))
+        assert pub_loaded == pub
+        assert pub_loaded.url == "exampleurl.com"
+        assert not hasattr(pub_loaded, "doi")
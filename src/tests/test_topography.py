@@ -0,0 +1,61 @@
+"""Test topography metrics on random embeddings, independently of API."""
+
+import numpy as np
+
+from sciterra.mapping import topography
+
+
+class TestBatchMetrics:
+    num_pubs = 60
+    kernel_size = 5
+
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(num_pubs, 16))
+    normalized_embeddings = embeddings / np.linalg.norm(
+        embeddings, axis=1, keepdims=True
+    )
+    cospsi_matrix = normalized_embeddings @ normalized_embeddings.T
+    publication_indices = np.arange(num_pubs)
+
+    def test_batch_metrics_equal_publication_metrics(self):
+        idx = self.publication_indices
+
+        # each publication has a different number of valid publications, some fewer than kernel_size
+        valid = np.zeros((self.num_pubs, self.num_pubs), dtype=bool)
+        for i in idx:
+            valid[i, self.rng.choice(self.num_pubs, size=i // 2, replace=False)] = True
+            valid[i, i] = False
+
+        estimates = topography.batch_metrics(
+            topography.BATCH_METRICS,
+            idx,
+            self.cospsi_matrix,
+            valid,
+            self.embeddings,
+            kernel_size=self.kernel_size,
+        )
+        assert np.isnan(estimates).any() and not np.isnan(estimates).all()
+
+        for i in idx:
+            args = (i, self.cospsi_matrix, np.flatnonzero(valid[i]))
+            asymmetry_args = args + (self.publication_indices, self.embeddings)
+            expected = [
+                topography.smoothing_length_metric(*args, self.kernel_size),
+                topography.density_metric(*args, self.kernel_size),
+                topography.edginess_metric(*asymmetry_args, self.kernel_size),
+                topography.kernel_constant_asymmetry_metric(
+                    *asymmetry_args, self.kernel_size
+                ),
+            ]
+            assert np.allclose(estimates[i], expected, equal_nan=True)
+
+    def test_smoothing_length(self):
+        i = 0
+        valid_indices = np.arange(1, self.num_pubs)
+        h = topography.smoothing_length_metric(
+            i, self.cospsi_matrix, valid_indices, self.kernel_size
+        )
+
+        # the arc length to the kernel_size-th nearest publication
+        cospsi = np.sort(self.cospsi_matrix[i, valid_indices])[::-1]
+        assert np.isclose(h, np.arccos(cospsi[self.kernel_size - 1]))
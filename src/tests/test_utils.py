@@ -0,0 +1,115 @@
+"""Test the API querying helpers in misc.utils, with a fake clock instead of waiting."""
+
+import pytest
+
+from requests.exceptions import ConnectionError
+
+from sciterra.misc import utils
+from sciterra.misc.utils import chunk_ids, keep_trying, TokenBucket
+
+
+class FakeClock:
+    """Replaces time.monotonic and time.sleep, so that sleeping advances the clock instantly."""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(utils.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(utils.time, "sleep", clock.sleep)
+    return clock
+
+
+class TestKeepTrying:
+    def test_retries_until_success(self, clock):
+        calls = []
+
+        @keep_trying(n_attempts=5, verbose=False)
+        def flaky():
+            calls.append(clock.now)
+            if len(calls) < 3:
+                raise ConnectionError
+            return "ok"
+
+        assert flaky() == "ok"
+        assert len(calls) == 3
+
+    def test_max_time(self, clock):
+        calls = []
+
+        @keep_trying(
+            n_attempts=100,
+            sleep_after_attempt=10,
+            max_sleep=30,
+            max_time=60,
+            verbose=False,
+        )
+        def failing():
+            calls.append(clock.now)
+            raise ConnectionError
+
+        with pytest.raises(ConnectionError):
+            failing()
+        assert 1 < len(calls) < 100
+        assert clock.now <= 60
+
+    def test_other_exceptions_not_retried(self, clock):
+        calls = []
+
+        @keep_trying(n_attempts=5, verbose=False)
+        def failing():
+            calls.append(clock.now)
+            raise ValueError
+
+        with pytest.raises(ValueError):
+            failing()
+        assert len(calls) == 1
+
+
+class TestTokenBucket:
+    def test_rate_and_burst(self, clock):
+        bucket = TokenBucket(rate=2, capacity=3)
+
+        def acquire_times(n: int) -> list[float]:
+            times = []
+            for _ in range(n):
+                bucket.acquire()
+                times.append(clock.now)
+            return times
+
+        # a full bucket allows a burst of capacity requests, then rate requests per second
+        start = clock.now
+        assert acquire_times(5) == pytest.approx([start] * 3 + [start + 0.5, start + 1])
+
+        # idling refills the bucket only up to capacity
+        clock.sleep(10)
+        start = clock.now
+        assert acquire_times(4) == pytest.approx([start] * 3 + [start + 0.5])
+
+
+class TestChunkIds:
+    def test_chunk_boundaries(self):
+        ids = [f"id_{i}" for i in range(7)]
+        assert list(chunk_ids(ids, call_size=3)) == [ids[:3], ids[3:6], ids[6:]]
+        assert list(chunk_ids(ids[:6], call_size=3)) == [ids[:3], ids[3:6]]
+        assert list(chunk_ids(ids, call_size=10)) == [ids]
+
+    def test_empty(self):
+        assert list(chunk_ids([], call_size=3)) == []
+
+    def test_lazy(self):
+        # chunks are taken from the ids as they are consumed, so any iterable works
+        ids = (f"id_{i}" for i in range(5))
+        chunks = chunk_ids(ids, call_size=2)
+        assert next(chunks) == ["id_0", "id_1"]
+        assert next(ids) == "id_2"
+        assert list(chunks) == [["id_3", "id_4"]]
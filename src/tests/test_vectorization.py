@@ -6,6 +6,7 @@ from tqdm import tqdm
 
 from sciterra.vectorization.vectorizer import Vectorizer
 from sciterra.vectorization import scibert, sbert, word2vec, bow, gpt2
+from sciterra.vectorization.cache import CachedVectorizer
 
 astro_corpus_1 = "src/tests/data/corpora/example.txt"
 model_path_1 = "src/tests/data/models/word2vec_model_example.model"
@@ -391,3 +392,56 @@ class TestBOWVectorizer:
         )
         cosine_matrix = cosine_distances(embeddings, embeddings)
         assert np.all(cosine_matrix == 0)
+
+
+##############################################################################
+# Cache
+##############################################################################
+
+
+class LengthVectorizer(Vectorizer):
+    """Embeds documents by their length, failing on empty documents."""
+
+    def __init__(self) -> None:
+        self.num_embedded = 0
+
+    def embed_documents(self, docs: list[str], **kwargs) -> dict[str, np.ndarray]:
+        self.num_embedded += len(docs)
+        success_indices = np.array([i for i, doc in enumerate(docs) if doc], dtype=int)
+        return {
+            "embeddings": np.array([[len(docs[i]), 1.0] for i in success_indices]),
+            "success_indices": success_indices,
+            "fail_indices": np.setdiff1d(np.arange(len(docs)), success_indices),
+        }
+
+
+class TestCachedVectorizer:
+    def test_cached_embeddings(self, tmp_path):
+        cache_fp = tmp_path / "embeddings.sqlite"
+        docs = [abstract_str, abstract_str[:194], ""]
+
+        result = CachedVectorizer(
+            LengthVectorizer(), cache_fp, "length"
+        ).embed_documents(docs)
+
+        # A new vectorizer reuses the cached embeddings
+        length_vectorizer = LengthVectorizer()
+        result_cached = CachedVectorizer(
+            length_vectorizer, cache_fp, "length"
+        ).embed_documents(docs)
+
+        assert length_vectorizer.num_embedded == 1  # only the failed document
+        assert np.array_equal(result["embeddings"], result_cached["embeddings"])
+        assert np.array_equal(result_cached["success_indices"], np.array([0, 1]))
+        assert np.array_equal(result_cached["fail_indices"], np.array([2]))
+
+    def test_cached_embeddings_model_name(self, tmp_path):
+        cache_fp = tmp_path / "embeddings.sqlite"
+        docs = [abstract_str, abstract_str[:194]]
+
+        CachedVectorizer(LengthVectorizer(), cache_fp, "length").embed_documents(docs)
+
+        # Embeddings cached under another model name are not reused
+        length_vectorizer = LengthVectorizer()
+        CachedVectorizer(length_vectorizer, cache_fp, "length-v2").embed_documents(docs)
+        assert length_vectorizer.num_embedded == 2